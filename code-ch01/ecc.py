@@ -1,4 +1,9 @@
-from unittest import TestCase
+from unittest import TestCase, skipIf
+
+try:
+    import numpy as np
+except ImportError:  # only FieldArray needs numpy
+    np = None
 
 
 # tag::source1[]
@@ -114,3 +119,234 @@ class FieldElementTest(TestCase):
         a = FieldElement(4, 31)
         b = FieldElement(11, 31)
         self.assertEqual(a**-4 * b, FieldElement(13, 31))
+
+
+class FieldArray:
+    '''Many elements of the same finite field stored in one NumPy array.
+
+    The arithmetic is the same as FieldElement's, done elementwise, so a
+    whole set of elements can be added, multiplied or exponentiated at
+    once instead of looping in Python. The other operand can be another
+    FieldArray of the same length, a FieldElement or an int (Python's or
+    NumPy's). An int can go on either side, but a FieldElement has to be
+    on the right (array * element, not element * array), since
+    FieldElement's own operators run first and don't know about arrays.
+
+    The numbers are kept as int64, so a product of two of them has to fit
+    in 63 bits. That limits the prime to less than 2**31.'''
+
+    max_prime = 2**31
+    # NumPy would otherwise treat an array on the right of one of its own
+    # integers as a sequence and loop over it, so make it use our
+    # reflected operators instead
+    __array_ufunc__ = None
+
+    def __init__(self, nums, prime):
+        if np is None:
+            raise ImportError('FieldArray needs numpy')
+        if prime >= self.max_prime:
+            error = 'Prime {} too big for int64 products'.format(prime)
+            raise ValueError(error)
+        nums = np.asarray(nums, dtype=np.int64)
+        if nums.size and (nums.min() < 0 or nums.max() >= prime):
+            error = 'Nums not in field range 0 to {}'.format(prime - 1)
+            raise ValueError(error)
+        self.nums = nums
+        self.prime = prime
+
+    @classmethod
+    def field(cls, prime):
+        '''Every element of the field of order prime: 0, 1, ..., prime-1'''
+        return cls(np.arange(prime, dtype=np.int64), prime)
+
+    @classmethod
+    def from_elements(cls, elements):
+        '''Packs FieldElements of one field into a FieldArray'''
+        elements = list(elements)
+        if not elements:
+            raise ValueError('Need at least one element to know the prime')
+        prime = elements[0].prime
+        if any(e.prime != prime for e in elements):
+            raise TypeError('Cannot mix elements from different fields')
+        return cls([e.num for e in elements], prime)
+
+    def __repr__(self):
+        return 'FieldArray_{}({})'.format(self.prime, self.nums.tolist())
+
+    def __len__(self):
+        return len(self.nums)
+
+    def __getitem__(self, index):
+        return FieldElement(int(self.nums[index]), self.prime)
+
+    def __iter__(self):
+        for num in self.nums:
+            yield FieldElement(int(num), self.prime)
+
+    def __eq__(self, other):
+        if not isinstance(other, FieldArray):
+            return False
+        return self.prime == other.prime \
+            and np.array_equal(self.nums, other.nums)
+
+    def __ne__(self, other):
+        return not (self == other)
+
+    @property
+    def num(self):
+        # FieldElement's operators read other.num when the FieldElement is
+        # on the left, so say what went wrong instead of AttributeError
+        raise TypeError('Put the FieldArray on the left of a FieldElement')
+
+    def _nums_of(self, other):
+        '''The numbers of the other operand, reduced into this field'''
+        if isinstance(other, FieldArray):
+            if self.prime != other.prime:
+                raise TypeError('Cannot operate on arrays from different fields')
+            if len(self) != len(other):
+                raise ValueError('Arrays have different lengths')
+            return other.nums
+        if isinstance(other, FieldElement):
+            if self.prime != other.prime:
+                raise TypeError('Cannot operate on elements from different fields')
+            return other.num
+        # NumPy integers too, which is what indexing .nums gives back
+        if isinstance(other, (int, np.integer)):
+            return int(other) % self.prime
+        return NotImplemented
+
+    def _new(self, nums):
+        # the results are already reduced, so skip the range check
+        result = FieldArray.__new__(FieldArray)
+        result.nums = nums
+        result.prime = self.prime
+        return result
+
+    def __add__(self, other):
+        nums = self._nums_of(other)
+        if nums is NotImplemented:
+            return NotImplemented
+        return self._new((self.nums + nums) % self.prime)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        nums = self._nums_of(other)
+        if nums is NotImplemented:
+            return NotImplemented
+        return self._new((self.nums - nums) % self.prime)
+
+    def __rsub__(self, other):
+        nums = self._nums_of(other)
+        if nums is NotImplemented:
+            return NotImplemented
+        return self._new((nums - self.nums) % self.prime)
+
+    def __mul__(self, other):
+        nums = self._nums_of(other)
+        if nums is NotImplemented:
+            return NotImplemented
+        return self._new(self.nums * nums % self.prime)
+
+    __rmul__ = __mul__
+
+    def __pow__(self, exponent):
+        # same as FieldElement: reduce the exponent by Fermat's little
+        # theorem so negative exponents work too, then square-and-multiply
+        # every element at once
+        n = exponent % (self.prime - 1)
+        result = np.ones_like(self.nums)
+        current = self.nums.copy()
+        while n:
+            if n & 1:
+                result = result * current % self.prime
+            current = current * current % self.prime
+            n >>= 1
+        return self._new(result)
+
+    def __truediv__(self, other):
+        nums = self._nums_of(other)
+        if nums is NotImplemented:
+            return NotImplemented
+        # like FieldElement, divide by multiplying by other**(p-2)
+        if isinstance(other, FieldArray):
+            inverse = other**(self.prime - 2)
+        else:
+            inverse = pow(nums, self.prime - 2, self.prime)
+        return self * inverse
+
+    def __rtruediv__(self, other):
+        nums = self._nums_of(other)
+        if nums is NotImplemented:
+            return NotImplemented
+        return self**(self.prime - 2) * nums
+
+
+@skipIf(np is None, 'numpy is not installed')
+class FieldArrayTest(TestCase):
+
+    def test_elementwise(self):
+        a = FieldArray([2, 17, 29, 24], 31)
+        b = FieldArray([15, 21, 4, 19], 31)
+        self.assertEqual(a + b, FieldArray([17, 7, 2, 12], 31))
+        self.assertEqual(a - b, FieldArray([18, 27, 25, 5], 31))
+        self.assertEqual(a * b, FieldArray([30, 16, 23, 22], 31))
+        for x, y, quotient in zip(a, b, a / b):
+            self.assertEqual(quotient.num * y.num % 31, x.num)
+
+    def test_pow(self):
+        a = FieldArray([17, 5, 4], 31)
+        self.assertEqual(a**3, FieldArray([15, 1, 2], 31))
+        self.assertEqual(a**-3, FieldArray([29, 1, 16], 31))
+        for x, y in zip(a**-4, a):
+            self.assertEqual(x, y**-4)
+
+    def test_scalars(self):
+        a = FieldArray([0, 1, 2, 30], 31)
+        k = FieldElement(3, 31)
+        self.assertEqual(a * k, FieldArray([0, 3, 6, 28], 31))
+        self.assertEqual(3 * a, a * k)
+        self.assertEqual(a + k, FieldArray([3, 4, 5, 2], 31))
+        self.assertEqual(a / k * k, a)
+        self.assertEqual(a[3], FieldElement(30, 31))
+        with self.assertRaises(TypeError):
+            a * FieldElement(3, 13)
+
+    def test_scalar_on_the_left(self):
+        a = FieldArray([1, 2, 30], 31)
+        self.assertEqual(5 + a, a + 5)
+        self.assertEqual(5 - a, FieldArray([4, 3, 6], 31))
+        self.assertEqual(5 * a, a * 5)
+        self.assertEqual(5 / a * a, FieldArray([5, 5, 5], 31))
+        self.assertEqual(1 / a, a**-1)
+        # a FieldElement has to go on the right
+        with self.assertRaises(TypeError):
+            FieldElement(3, 31) + a
+        with self.assertRaises(ValueError):
+            FieldArray([31], 31)
+
+    def test_field_sweeps(self):
+        for prime in (7, 13, 19, 31, 65521):
+            field = FieldArray.field(prime)
+            nonzero = FieldArray(field.nums[1:], prime)
+            # multiplying by any nonzero k permutes the field
+            for k in (1, 3, prime - 1):
+                self.assertEqual(sorted((k * field).nums.tolist()),
+                                 list(range(prime)))
+            # Fermat's little theorem: n**(p-1) is 1 for every nonzero n
+            self.assertTrue(((nonzero**(prime - 1)).nums == 1).all())
+            self.assertEqual(nonzero / nonzero, nonzero**0)
+
+    def test_numpy_scalars(self):
+        prime = 13
+        field = FieldArray.field(prime)
+        a = FieldArray([1, 5, 12], prime)
+        for k in field.nums:
+            want = FieldArray([int(k) * n % prime for n in a.nums], prime)
+            self.assertEqual(a * k, want)
+            self.assertEqual(k * a, want)
+            self.assertEqual(k + a, a + int(k))
+            self.assertEqual(k - a, int(k) - a)
+            self.assertEqual(k / a * a, FieldArray([int(k)] * len(a), prime))
+            if k:
+                self.assertEqual(a / k * k, a)
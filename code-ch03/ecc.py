@@ -219,6 +219,14 @@ class Point:
         return result
     # end::source3[]
 
+    def generate_group(self):
+        '''Returns the SmallGroup generated by this point'''
+        return SmallGroup(self)
+
+    def order(self):
+        '''Returns the smallest n such that n * self is the point at infinity'''
+        return self.generate_group().order
+
 
 class PointTest(TestCase):
 
@@ -334,6 +342,124 @@ class ECCTest(TestCase):
             self.assertEqual(s * p1, p2)
 
 
+# largest prime for which we're willing to precompute a whole group
+MAX_SMALL_PRIME = 2**16
+
+
+class SmallGroup:
+    '''The group generated by a point on a curve over a small prime field,
+    with every element precomputed. Element i is i * generator, so adding
+    points is adding their indexes mod the order of the group.'''
+
+    def __init__(self, generator):
+        if generator.x is not None and not isinstance(generator.x, FieldElement):
+            raise TypeError('{} is not over a finite field'.format(generator))
+        self.a = generator.a
+        self.b = generator.b
+        prime = self.a.prime
+        if prime >= MAX_SMALL_PRIME:
+            raise ValueError('prime {} is too large to precompute'.format(prime))
+        # coordinates[i] is i * generator as a pair of integers,
+        # with None for the point at infinity
+        self.coordinates = [None]
+        if generator.x is not None:
+            self.coordinates.extend(
+                self.multiples(generator.x.num, generator.y.num, self.a.num, prime))
+        self.order = len(self.coordinates)
+        self.indexes = {xy: i for i, xy in enumerate(self.coordinates)}
+
+    @staticmethod
+    def multiples(x, y, a, prime):
+        '''Returns [(x, y), 2*(x, y), ...] up to the point at infinity
+        using plain integers, which is much faster than going through
+        FieldElement and Point for every addition'''
+        result = [(x, y)]
+        current_x, current_y = x, y
+        while True:
+            if current_x == x:
+                if current_y != y or y == 0:
+                    # current is -generator, so the next one is infinity
+                    break
+                # current is the generator itself, so we double
+                s = (3 * x * x + a) * pow(2 * y, prime - 2, prime) % prime
+            else:
+                s = (y - current_y) * pow(x - current_x, prime - 2, prime) % prime
+            new_x = (s * s - current_x - x) % prime
+            current_y = (s * (current_x - new_x) - current_y) % prime
+            current_x = new_x
+            result.append((current_x, current_y))
+        return result
+
+    def __len__(self):
+        return self.order
+
+    def __iter__(self):
+        for i in range(self.order):
+            yield self.point(i)
+
+    def point(self, index):
+        '''Returns index * generator as a Point'''
+        xy = self.coordinates[index % self.order]
+        if xy is None:
+            return Point(None, None, self.a, self.b)
+        prime = self.a.prime
+        x = FieldElement(xy[0], prime)
+        y = FieldElement(xy[1], prime)
+        return Point(x, y, self.a, self.b)
+
+    def index(self, point):
+        '''Returns the i such that point is i * generator'''
+        if point.x is None:
+            return 0
+        try:
+            return self.indexes[(point.x.num, point.y.num)]
+        except KeyError:
+            raise ValueError('{} is not in this group'.format(point))
+
+    def add(self, point1, point2):
+        return self.point(self.index(point1) + self.index(point2))
+
+    def multiply(self, coefficient, point):
+        return self.point(coefficient * self.index(point))
+
+
+class SmallGroupTest(TestCase):
+
+    def test_group(self):
+        prime = 223
+        a = FieldElement(0, prime)
+        b = FieldElement(7, prime)
+        x = FieldElement(15, prime)
+        y = FieldElement(86, prime)
+        p = Point(x, y, a, b)
+        self.assertEqual(p.order(), 7)
+        group = p.generate_group()
+        # the table has to agree with repeated addition
+        current = Point(None, None, a, b)
+        for i, point in enumerate(group):
+            self.assertEqual(point, current)
+            self.assertEqual(group.index(point), i)
+            current += p
+        self.assertEqual(group.add(group.point(3), group.point(5)), group.point(1))
+        self.assertEqual(group.multiply(5, group.point(3)), 15 * p)
+        p = Point(FieldElement(47, prime), FieldElement(71, prime), a, b)
+        self.assertEqual(p.order(), 21)
+        self.assertEqual(Point(None, None, a, b).order(), 1)
+        with self.assertRaises(ValueError):
+            group.index(p)
+
+    def test_large_group(self):
+        prime = 65519
+        a = FieldElement(0, prime)
+        b = FieldElement(7, prime)
+        x = FieldElement(1, prime)
+        y = FieldElement(19440, prime)
+        p = Point(x, y, a, b)
+        group = p.generate_group()
+        self.assertIsNone((group.order * p).x)
+        self.assertEqual(group.point(1000), 1000 * p)
+
+
 # tag::source6[]
 A = 0
 B = 7
@@ -0,0 +1,134 @@
+'''Benchmarks for the performance work on this chapter's code.
+
+Run with: python benchmark.py
+'''
+from random import randint
+from time import perf_counter
+from timeit import timeit
+
+import tracemalloc
+
+from ecc import (
+    FieldElement,
+    G,
+    inverse_mod,
+    inverse_p,
+    multi_scalar_mul,
+    N,
+    P,
+    Point,
+    PrivateKey,
+    S256Point,
+    Signature,
+    sqrt_p,
+    verify_schnorr_batch,
+)
+from hd import ExtendedKey
+from script import p2pkh_script
+from tx import Tx, TxIn, TxOut
+
+
+def bytes_per_object(make, count=10000):
+    '''Returns the average number of bytes allocated per object made by
+    calling make(i), including everything the object references'''
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [make(i) for i in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # don't count the list holding the objects
+    return (after - before) / len(objects) - 8
+
+
+def bench_memory():
+    print('memory per object (bytes, including referenced objects)')
+    points = [randint(1, N) * G for _ in range(10)]
+    h160 = bytes(20)
+    makers = (
+        ('FieldElement', lambda i: FieldElement(i, 2**31 - 1)),
+        ('Point', lambda i: Point(None, None, 5, 7)),
+        ('S256Point', lambda i: S256Point.unchecked(
+            points[i % 10].x.num, points[i % 10].y.num)),
+        ('Signature', lambda i: Signature(2**255 + i, 2**254 + i)),
+        ('TxIn', lambda i: TxIn(bytes(32), i)),
+        ('TxOut', lambda i: TxOut(i, p2pkh_script(h160))),
+        ('Tx', lambda i: Tx(1, [], [], i)),
+    )
+    for name, make in makers:
+        print('  {:<14}{:>8.0f}'.format(name, bytes_per_object(make)))
+
+
+def timed(function, *args):
+    '''Returns how many seconds function(*args) takes'''
+    start = perf_counter()
+    function(*args)
+    return perf_counter() - start
+
+
+def naive_sum(scalars, points):
+    total = S256Point(None, None)
+    for scalar, point in zip(scalars, points):
+        total += scalar * point
+    return total
+
+
+def bench_multi_scalar_mul(sizes=(2, 64, 1024, 8192)):
+    print('sum of scalar * point (seconds)')
+    print('  {:>6}{:>12}{:>18}'.format('terms', 'naive', 'multi_scalar_mul'))
+    for size in sizes:
+        scalars = [randint(1, N) for _ in range(size)]
+        points = [randint(1, N) * G for _ in range(size)]
+        naive = timed(naive_sum, scalars, points)
+        fast = timed(multi_scalar_mul, scalars, points)
+        print('  {:>6}{:>12.3f}{:>18.3f}'.format(size, naive, fast))
+
+
+def bench_field_ops(count=2000):
+    print('field operations mod P (microseconds each)')
+    nums = [randint(1, P - 1) for _ in range(count)]
+    secs = [(randint(1, N) * G).sec() for _ in range(count // 10)]
+    cases = (
+        ('sqrt pow', lambda n: pow(n, (P + 1) // 4, P), nums),
+        ('sqrt chain', sqrt_p, nums),
+        ('inverse pow', lambda n: pow(n, P - 2, P), nums),
+        ('inverse chain', inverse_p, nums),
+        ('inverse_mod', lambda n: inverse_mod(n, P), nums),
+        ('parse_uncached', S256Point.parse_uncached, secs),
+    )
+    for name, function, inputs in cases:
+        seconds = timeit(lambda: [function(i) for i in inputs], number=1)
+        print('  {:<16}{:>8.1f}'.format(name, seconds / len(inputs) * 1e6))
+
+
+def bench_schnorr(sizes=(16, 128, 1024)):
+    print('verifying Schnorr signatures (milliseconds per signature)')
+    print('  {:>6}{:>12}{:>12}'.format('sigs', 'one by one', 'batch'))
+    for size in sizes:
+        items = []
+        for i in range(size):
+            pk = PrivateKey(randint(1, N - 1))
+            msg = i.to_bytes(4, 'big')
+            items.append((pk.point, msg, pk.sign_schnorr(msg)))
+        single = timed(lambda: all(p.verify_schnorr(m, s) for p, m, s in items))
+        batch = timed(verify_schnorr_batch, items)
+        print('  {:>6}{:>12.3f}{:>12.3f}'.format(
+            size, single / size * 1000, batch / size * 1000))
+
+
+def bench_hd(count=10000):
+    print('deriving {} child addresses (seconds)'.format(count))
+    account = ExtendedKey.from_seed(bytes(32)).derive("m/44'/0'/0'/0")
+    account.child(0)
+    secrets = [child.secret for child in account.children(0, count)]
+    naive = timed(lambda: [PrivateKey(s).point.address() for s in secrets])
+    fast = timed(lambda: [c.address() for c in account.neuter().children(0, count)])
+    print('  secret * G each {:>8.2f}'.format(naive))
+    print('  children        {:>8.2f}'.format(fast))
+
+
+if __name__ == '__main__':
+    bench_memory()
+    bench_multi_scalar_mul()
+    bench_field_ops()
+    bench_schnorr()
+    bench_hd()
@@ -1,14 +1,22 @@
-from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from random import randint
+from tempfile import TemporaryDirectory
 from unittest import TestCase
 
 import hashlib
 import hmac
+import json
+import multiprocessing
+import os
+import pickle
+import weakref
 
-from helper import encode_base58_checksum, hash160
+from helper import encode_base58_checksum, hash160, tagged_hash
 
 
 class FieldElement:
+    __slots__ = ('num', 'prime')
 
     def __init__(self, num, prime):
         if num >= prime or num < 0:
@@ -134,7 +142,67 @@ class FieldElementTest(TestCase):
         self.assertEqual(a**-4 * b, FieldElement(13, 31))
 
 
+try:
+    # from Python 3.8 on, pow(n, -1, p) inverts n directly
+    NATIVE_INVERSE = pow(2, -1, 3) == 2
+except ValueError:
+    NATIVE_INVERSE = False
+
+
+def inverse_mod(num, prime):
+    '''Returns 1/num mod prime. Like pow(num, prime-2, prime), which it
+    replaces, it returns 0 for num == 0.'''
+    num %= prime
+    if num == 0:
+        return 0
+    if NATIVE_INVERSE:
+        # the extended Euclidean algorithm in C, several times faster
+        # than the exponentiation Fermat's little theorem needs
+        return pow(num, -1, prime)
+    if prime == P:
+        return inverse_p(num)
+    return pow(num, prime - 2, prime)
+
+
+def batch_inverse(nums, prime):
+    '''Returns the inverses mod prime of a list of integers using a single
+    exponentiation (Montgomery's trick)'''
+    # prefixes[i] is the product of all the numbers before i
+    prefixes = []
+    product = 1
+    for num in nums:
+        if num % prime == 0:
+            raise ZeroDivisionError('Cannot invert 0')
+        prefixes.append(product)
+        product = product * num % prime
+    # 1/(n0*n1*...*nk), which we peel one number off at a time
+    inverse = inverse_mod(product, prime)
+    result = [None] * len(nums)
+    for i in reversed(range(len(nums))):
+        result[i] = inverse * prefixes[i] % prime
+        inverse = inverse * nums[i] % prime
+    return result
+
+
+class BatchInverseTest(TestCase):
+
+    def test_batch_inverse(self):
+        nums = [1, 2, 3, 30, 17]
+        want = [pow(n, 29, 31) for n in nums]
+        self.assertEqual(batch_inverse(nums, 31), want)
+        self.assertEqual(batch_inverse([], 31), [])
+        with self.assertRaises(ZeroDivisionError):
+            batch_inverse([3, 31], 31)
+
+    def test_inverse_mod(self):
+        for prime in (31, 2**31 - 1):
+            for num in (1, 2, 17, prime - 1, prime + 3):
+                self.assertEqual(inverse_mod(num, prime), pow(num, prime - 2, prime))
+        self.assertEqual(inverse_mod(0, 31), 0)
+
+
 class Point:
+    __slots__ = ('a', 'b', 'x', 'y')
 
     def __init__(self, x, y, a, b):
         self.a = a
@@ -360,7 +428,54 @@ P = 2**256 - 2**32 - 977
 N = 0xfffffffffffffffffffffffffffffffebaaedce6af48a03bbfd25e8cd0364141
 
 
+def square_repeat(x, n):
+    '''Returns x**(2**n) mod P'''
+    for _ in range(n):
+        x = x * x % P
+    return x
+
+
+def power_chain(a):
+    '''Shared start of the addition chains for P. Writing xk for
+    a**(2**k - 1), returns (x223, x22, x2). Each xk comes from smaller
+    ones since xj**(2**k) * xk is x(j+k).'''
+    x2 = square_repeat(a, 1) * a % P
+    x3 = square_repeat(x2, 1) * a % P
+    x6 = square_repeat(x3, 3) * x3 % P
+    x9 = square_repeat(x6, 3) * x3 % P
+    x11 = square_repeat(x9, 2) * x2 % P
+    x22 = square_repeat(x11, 11) * x11 % P
+    x44 = square_repeat(x22, 22) * x22 % P
+    x88 = square_repeat(x44, 44) * x44 % P
+    x176 = square_repeat(x88, 88) * x88 % P
+    x220 = square_repeat(x176, 44) * x44 % P
+    x223 = square_repeat(x220, 3) * x3 % P
+    return x223, x22, x2
+
+
+def sqrt_p(a):
+    '''Returns a**((P+1)//4) mod P using 253 squarings and 13
+    multiplications instead of a generic exponentiation'''
+    # (P+1)//4 in binary is 223 ones, a 0, 22 ones, 4 zeros, 2 ones, 2 zeros
+    t, x22, x2 = power_chain(a)
+    t = square_repeat(t, 23) * x22 % P
+    t = square_repeat(t, 6) * x2 % P
+    return square_repeat(t, 2)
+
+
+def inverse_p(a):
+    '''Returns a**(P-2) mod P, which is 1/a, using 255 squarings and 15
+    multiplications'''
+    # P-2 in binary is 223 ones, a 0, 22 ones, 4 zeros, then 101101
+    t, x22, x2 = power_chain(a)
+    t = square_repeat(t, 23) * x22 % P
+    t = square_repeat(t, 5) * a % P
+    t = square_repeat(t, 3) * x2 % P
+    return square_repeat(t, 2) * a % P
+
+
 class S256Field(FieldElement):
+    __slots__ = ()
 
     def __init__(self, num, prime=None):
         super().__init__(num=num, prime=P)
@@ -368,18 +483,57 @@ class S256Field(FieldElement):
     def __repr__(self):
         return '{:x}'.format(self.num).zfill(64)
 
+    def __truediv__(self, other):
+        if self.prime != other.prime:
+            raise TypeError('Cannot divide two numbers in different Fields')
+        return self.__class__(self.num * inverse_mod(other.num, P) % P)
+
     def sqrt(self):
-        return self**((P + 1) // 4)
+        return self.__class__(sqrt_p(self.num))
+
+
+# every S256Point shares these instead of making new ones each time
+S256_A = S256Field(A)
+S256_B = S256Field(B)
+
+
+# _verify_count of a key that was refused a table for lack of budget
+TABLE_REFUSED = -1
 
 
 class S256Point(Point):
+    __slots__ = ('_verify_count', '_table', '_encodings', '__weakref__')
+    # keys verified more than this many times get their own table
+    table_threshold = 16
+    table_width = 8
+    # limit on the number of table entries across all keys
+    table_budget = 1 << 17
+    # weak references to the points that currently have a table
+    table_owners = []
 
     def __init__(self, x, y, a=None, b=None):
-        a, b = S256Field(A), S256Field(B)
+        a, b = S256_A, S256_B
         if type(x) == int:
             super().__init__(x=S256Field(x), y=S256Field(y), a=a, b=b)
         else:
             super().__init__(x=x, y=y, a=a, b=b)
+        self._verify_count = 0
+        self._table = None
+        self._encodings = None
+
+    @classmethod
+    def unchecked(cls, x, y):
+        '''Makes a point from integer coordinates that are already known
+        to be on the curve, skipping the curve equation check'''
+        point = cls.__new__(cls)
+        point.a = S256_A
+        point.b = S256_B
+        point.x = S256Field(x)
+        point.y = S256Field(y)
+        point._verify_count = 0
+        point._table = None
+        point._encodings = None
+        return point
 
     def __repr__(self):
         if self.x is None:
@@ -387,71 +541,284 @@ class S256Point(Point):
         else:
             return 'S256Point({}, {})'.format(self.x, self.y)
 
+    def __add__(self, other):
+        if not isinstance(other, S256Point):
+            return super().__add__(other)
+        if self.x is None:
+            return other
+        if other.x is None:
+            return self
+        # add using integers and a single inversion
+        return from_jacobian(jacobian_add(
+            (self.x.num, self.y.num, 1), (other.x.num, other.y.num, 1)))
+
     def __rmul__(self, coefficient):
         coef = coefficient % N
-        return super().__rmul__(coef)
+        if self.x is None or coef == 0:
+            return self.__class__(None, None)
+        if self.x.num == G.x.num and self.y.num == G.y.num:
+            # multiples of G come from the precomputed table
+            return from_jacobian(GeneratorTable.multiply(coef))
+        return from_jacobian(strauss(self._glv_terms(coef)))
+
+    def _glv_terms(self, coefficient):
+        # split the coefficient in two ~128-bit halves using the
+        # endomorphism so that we only need half as many doublings
+        if self.x.num == G.x.num and self.y.num == G.y.num:
+            return GeneratorTable.glv_terms(coefficient)
+        if self._table is not None:
+            table, endo_table = self._table
+            return glv_terms(coefficient, table, self.table_width, endo_table)
+        table = odd_multiples((self.x.num, self.y.num, 1), 5)
+        return glv_terms(coefficient, table, 5)
+
+    def _build_table(self):
+        '''Precomputes a wide odd multiples table for this key, unless
+        that would go over the table budget'''
+        # dereference each owner just once, since another thread can drop
+        # the last reference to it at any time
+        live = [point for point in (ref() for ref in S256Point.table_owners)
+                if point is not None]
+        owners = [weakref.ref(point) for point in live]
+        used = sum(2 * len(point._table[0]) for point in live)
+        size = 1 << (self.table_width - 2)
+        if used + 2 * size > self.table_budget:
+            S256Point.table_owners = owners
+            # turned down, so don't try again on every later verify
+            self._verify_count = TABLE_REFUSED
+            return
+        base = (self.x.num, self.y.num, 1)
+        table = [
+            (x, y, 1) for x, y in
+            jacobian_to_affine_batch(odd_multiples(base, self.table_width))]
+        self._table = (table, endomorphism_table(table))
+        owners.append(weakref.ref(self))
+        S256Point.table_owners = owners
 
     def verify(self, z, sig):
-        # By Fermat's Little Theorem, 1/s = pow(s, N-2, N)
-        s_inv = pow(sig.s, N - 2, N)
+        return get_backend().verify(self, z, sig)
+
+    def _verify(self, z, sig):
+        # 1/s, which by Fermat's Little Theorem is pow(s, N-2, N)
+        s_inv = inverse_mod(sig.s, N)
         # u = z / s
         u = z * s_inv % N
         # v = r / s
         v = sig.r * s_inv % N
+        return self._verify_uv(u, v, sig.r)
+
+    def _verify_uv(self, u, v, r):
+        # keys that keep coming back are worth a precomputed table
+        if self._table is None and self._verify_count != TABLE_REFUSED:
+            self._verify_count += 1
+            if self._verify_count > self.table_threshold:
+                self._build_table()
         # u*G + v*P should have as the x coordinate, r
-        total = u * G + v * self
-        return total.x.num == sig.r
+        # both products share the same doublings using Shamir's trick
+        total = strauss([
+            *GeneratorTable.glv_terms(u),
+            *self._glv_terms(v),
+        ])
+        return jacobian_x_equals(total, r)
+
+    def verify_schnorr(self, msg, sig):
+        '''Returns whether sig is a valid BIP340 signature of msg (bytes)
+        for this point's x-only key'''
+        if sig.r >= P or sig.s >= N:
+            return False
+        e = schnorr_challenge(sig.r, self.xonly(), msg)
+        # the x-only key stands for the point with an even y, which is
+        # -self when our y is odd: -e * -self == e * self
+        if self.y.num % 2 == 0:
+            e = N - e
+        # R = s*G - e*P has to have an even y and x coordinate r
+        total = strauss([
+            *GeneratorTable.glv_terms(sig.s),
+            *self._glv_terms(e),
+        ])
+        if total[2] == 0:
+            return False
+        x, y = jacobian_to_affine(total)
+        return y % 2 == 0 and x == sig.r
+
+    def __hash__(self):
+        if self.x is None:
+            return hash(None)
+        return hash((self.x.num, self.y.num))
+
+    def _recall(self, key):
+        # encodings are remembered per point since wallets ask for the
+        # same ones over and over
+        if self._encodings is None:
+            return None
+        return self._encodings.get(key)
+
+    def _remember(self, key, value):
+        if self._encodings is None:
+            self._encodings = {}
+        self._encodings[key] = value
+        return value
 
     def sec(self, compressed=True):
         '''returns the binary version of the SEC format'''
+        key = ('sec', compressed)
+        result = self._recall(key)
+        if result is not None:
+            return result
         # if compressed, starts with b'\x02' if self.y.num is even, b'\x03' if self.y is odd
         # then self.x.num
         # remember, you have to convert self.x.num/self.y.num to binary (some_integer.to_bytes(32, 'big'))
         if compressed:
             if self.y.num % 2 == 0:
-                return b'\x02' + self.x.num.to_bytes(32, 'big')
+                result = b'\x02' + self.x.num.to_bytes(32, 'big')
             else:
-                return b'\x03' + self.x.num.to_bytes(32, 'big')
+                result = b'\x03' + self.x.num.to_bytes(32, 'big')
         else:
             # if non-compressed, starts with b'\x04' followod by self.x and then self.y
-            return b'\x04' + self.x.num.to_bytes(32, 'big') + \
+            result = b'\x04' + self.x.num.to_bytes(32, 'big') + \
                 self.y.num.to_bytes(32, 'big')
+        return self._remember(key, result)
+
+    def xonly(self):
+        '''returns the 32 byte x-only (BIP340) encoding of this point'''
+        return self.x.num.to_bytes(32, 'big')
 
     def hash160(self, compressed=True):
-        return hash160(self.sec(compressed))
+        key = ('hash160', compressed)
+        result = self._recall(key)
+        if result is not None:
+            return result
+        return self._remember(key, hash160(self.sec(compressed)))
 
     def address(self, compressed=True, testnet=False):
         '''Returns the address string'''
+        key = ('address', compressed, testnet)
+        result = self._recall(key)
+        if result is not None:
+            return result
         h160 = self.hash160(compressed)
         if testnet:
             prefix = b'\x6f'
         else:
             prefix = b'\x00'
-        return encode_base58_checksum(prefix + h160)
+        return self._remember(key, encode_base58_checksum(prefix + h160))
 
     @classmethod
     def parse(self, sec_bin):
+        '''returns a Point object from a SEC binary (not hex)'''
+        return get_backend().parse_sec(bytes(sec_bin))
+
+    @classmethod
+    def parse_many(cls, secs):
+        '''Parses a list of SEC public keys. Repeated keys are parsed once.'''
+        points = {}
+        result = []
+        for sec_bin in secs:
+            sec_bin = bytes(sec_bin)
+            point = points.get(sec_bin)
+            if point is None:
+                point = points[sec_bin] = cls.parse(sec_bin)
+            result.append(point)
+        return result
+
+    @classmethod
+    def parse_xonly(cls, xonly_bin):
+        '''returns the point with an even y for a 32 byte x-only key'''
+        if len(xonly_bin) != 32:
+            raise ValueError('x-only keys are 32 bytes')
+        x = int.from_bytes(xonly_bin, 'big')
+        y = lift_x(x)
+        if y % 2 == 1:
+            y = P - y
+        return cls.unchecked(x, y)
+
+    @classmethod
+    def parse_uncached(self, sec_bin):
         '''returns a Point object from a SEC binary (not hex)'''
         if sec_bin[0] == 4:
             x = int.from_bytes(sec_bin[1:33], 'big')
             y = int.from_bytes(sec_bin[33:65], 'big')
             return S256Point(x=x, y=y)
         is_even = sec_bin[0] == 2
-        x = S256Field(int.from_bytes(sec_bin[1:], 'big'))
-        # right side of the equation y^2 = x^3 + 7
-        alpha = x**3 + S256Field(B)
-        # solve for left side
-        beta = alpha.sqrt()
-        if beta.num % 2 == 0:
+        x = int.from_bytes(sec_bin[1:], 'big')
+        beta = lift_x(x)
+        if beta % 2 == 0:
             even_beta = beta
-            odd_beta = S256Field(P - beta.num)
+            odd_beta = P - beta
         else:
-            even_beta = S256Field(P - beta.num)
+            even_beta = P - beta
             odd_beta = beta
+        # we just solved the curve equation, no need to check it again
         if is_even:
-            return S256Point(x, even_beta)
+            return S256Point.unchecked(x, even_beta)
         else:
-            return S256Point(x, odd_beta)
+            return S256Point.unchecked(x, odd_beta)
+
+
+def lift_x(x):
+    '''Returns a y (either one) such that (x, y) is on the curve, or
+    raises ValueError if there isn't one'''
+    if x >= P:
+        raise ValueError('x coordinate {:x} is not in the field'.format(x))
+    # right side of the equation y^2 = x^3 + 7
+    alpha = (x * x * x + B) % P
+    # solve for left side
+    beta = sqrt_p(alpha)
+    if beta * beta % P != alpha:
+        raise ValueError('{:x} is not the x coordinate of a point'.format(x))
+    return beta
+
+
+# number of parsed public keys to keep around
+SEC_CACHE_SIZE = 4096
+
+
+def read_sec(buf, offset=0):
+    '''Parses the SEC public key starting at offset in buf (bytes, a
+    bytearray or a memoryview) and returns (point, offset just past it)'''
+    if offset >= len(buf):
+        raise ValueError('No SEC public key at offset {}'.format(offset))
+    prefix = buf[offset]
+    if prefix == 4:
+        end = offset + 65
+    elif prefix in (2, 3):
+        end = offset + 33
+    else:
+        raise ValueError('Bad SEC prefix {}'.format(prefix))
+    if end > len(buf):
+        raise ValueError('SEC public key is cut off')
+    return S256Point.parse(buf[offset:end]), end
+
+
+def write_sec(point, buf, offset=0, compressed=True):
+    '''Writes the SEC encoding of point into buf (a bytearray or writable
+    memoryview with room for it) at offset and returns the offset just
+    past it'''
+    x = point.x.num.to_bytes(32, 'big')
+    y = point.y.num
+    if compressed:
+        end = offset + 33
+        if end > len(buf):
+            raise ValueError('No room for the public key')
+        buf[offset] = 2 + (y & 1)
+    else:
+        end = offset + 65
+        if end > len(buf):
+            raise ValueError('No room for the public key')
+        buf[offset] = 4
+        buf[offset + 33:end] = y.to_bytes(32, 'big')
+    buf[offset + 1:offset + 33] = x
+    return end
+
+
+@lru_cache(maxsize=SEC_CACHE_SIZE)
+def parse_sec(sec_bin):
+    '''S256Point.parse_uncached with an LRU cache keyed by the SEC bytes.
+    Decompressing a key costs a full exponentiation, which we'd rather
+    not repeat for every input spending from the same key.
+    lru_cache is thread-safe and parse_sec.cache_info() reports the
+    hits and misses.'''
+    return S256Point.parse_uncached(sec_bin)
 
 
 G = S256Point(
@@ -459,12 +826,629 @@ G = S256Point(
     0x483ada7726a3c4655da4fbfc0e1108a8fd17b448a68554199c47d08ffb10d4b8)
 
 
+# Jacobian coordinates (X, Y, Z) represent the affine point (X/Z**2, Y/Z**3).
+# Adding and doubling in this form needs no division, so a whole scalar
+# multiplication can be done with a single inversion at the end.
+# The point at infinity is any triple with Z == 0.
+INFINITY = (1, 1, 0)
+
+
+def jacobian_double(p):
+    '''Doubles a point in Jacobian coordinates (secp256k1 has a = 0)'''
+    x1, y1, z1 = p
+    if z1 == 0 or y1 == 0:
+        return INFINITY
+    yy = y1 * y1 % P
+    s = 4 * x1 * yy % P
+    m = 3 * x1 * x1 % P
+    x3 = (m * m - 2 * s) % P
+    y3 = (m * (s - x3) - 8 * yy * yy) % P
+    z3 = 2 * y1 * z1 % P
+    return (x3, y3, z3)
+
+
+def jacobian_add(p, q):
+    '''Adds two points in Jacobian coordinates'''
+    x1, y1, z1 = p
+    x2, y2, z2 = q
+    if z1 == 0:
+        return q
+    if z2 == 0:
+        return p
+    z1z1 = z1 * z1 % P
+    u2 = x2 * z1z1 % P
+    s2 = y2 * z1 * z1z1 % P
+    if z2 == 1:
+        # q is affine, which saves a few multiplications
+        u1, s1 = x1, y1
+    else:
+        z2z2 = z2 * z2 % P
+        u1 = x1 * z2z2 % P
+        s1 = y1 * z2 * z2z2 % P
+    if u1 == u2:
+        # same x coordinate, so either p == q or p == -q
+        if s1 != s2:
+            return INFINITY
+        return jacobian_double(p)
+    h = (u2 - u1) % P
+    r = (s2 - s1) % P
+    hh = h * h % P
+    hhh = h * hh % P
+    v = u1 * hh % P
+    x3 = (r * r - hhh - 2 * v) % P
+    y3 = (r * (v - x3) - s1 * hhh) % P
+    z3 = h * z1 * z2 % P
+    return (x3, y3, z3)
+
+
+def jacobian_to_affine(p):
+    '''Converts a Jacobian triple (not infinity) into an (x, y) pair of ints'''
+    x, y, z = p
+    z_inv = inverse_mod(z, P)
+    z_inv2 = z_inv * z_inv % P
+    return (x * z_inv2 % P, y * z_inv2 * z_inv % P)
+
+
+def from_jacobian(p):
+    '''Converts a Jacobian triple back into an S256Point'''
+    if p[2] == 0:
+        return S256Point(None, None)
+    x, y = jacobian_to_affine(p)
+    return S256Point.unchecked(x, y)
+
+
+def jacobian_to_affine_batch(points):
+    '''Converts a list of Jacobian triples into (x, y) pairs of ints
+    (None for the point at infinity) with a single inversion'''
+    finite = [i for i, p in enumerate(points) if p[2] != 0]
+    z_invs = batch_inverse([points[i][2] for i in finite], P)
+    result = [None] * len(points)
+    for i, z_inv in zip(finite, z_invs):
+        x, y, _ = points[i]
+        z_inv2 = z_inv * z_inv % P
+        result[i] = (x * z_inv2 % P, y * z_inv2 * z_inv % P)
+    return result
+
+
+def normalize_batch(points):
+    '''Converts a list of Jacobian triples into S256Points with a single
+    inversion'''
+    result = []
+    for affine in jacobian_to_affine_batch(points):
+        if affine is None:
+            result.append(S256Point(None, None))
+        else:
+            result.append(S256Point.unchecked(*affine))
+    return result
+
+
+def jacobian_x_equals(p, r):
+    '''Returns whether the affine x coordinate of p is r (mod N),
+    comparing X against r*Z**2 so that no inversion is needed'''
+    x, _, z = p
+    if z == 0:
+        return False
+    zz = z * z % P
+    if x == r * zz % P:
+        return True
+    # x can also be r + N as long as that's still less than P
+    return r + N < P and x == (r + N) * zz % P
+
+
+class GeneratorTable:
+    '''Precomputed multiples of G. rows[i][j] is j * 2**(window*i) * G
+    as an affine (x, y) pair, so secret * G is just one addition per
+    window of the secret and no doublings at all.'''
+    window = 4
+    rows = None
+    wnaf_width = 8
+    odd_table = None
+    endo_table = None
+
+    @classmethod
+    def get(cls):
+        '''Returns the table, building it the first time it's needed'''
+        if cls.rows is None:
+            cls.rows = cls.build()
+        return cls.rows
+
+    @classmethod
+    def build(cls):
+        size = 1 << cls.window
+        base = (G.x.num, G.y.num, 1)
+        points = []
+        for _ in range(0, 256, cls.window):
+            current = base
+            for _ in range(1, size):
+                points.append(current)
+                current = jacobian_add(current, base)
+            # current is now size * base, the base of the next row
+            base = current
+        # convert everything to affine at once
+        affine = jacobian_to_affine_batch(points)
+        # row[0] would be the point at infinity, which we never look up
+        return [
+            [None] + affine[i:i + size - 1]
+            for i in range(0, len(affine), size - 1)
+        ]
+
+    @classmethod
+    def multiply(cls, coefficient):
+        '''Returns coefficient * G as a Jacobian triple'''
+        rows = cls.get()
+        mask = (1 << cls.window) - 1
+        result = INFINITY
+        i = 0
+        while coefficient:
+            digit = coefficient & mask
+            if digit:
+                x, y = rows[i][digit]
+                result = jacobian_add(result, (x, y, 1))
+            coefficient >>= cls.window
+            i += 1
+        return result
+
+    @classmethod
+    def multiply_batch(cls, coefficients, offset=None):
+        '''Returns offset + coefficient * G for every coefficient as an
+        affine (x, y) pair, or None for the point at infinity. offset is
+        an affine pair too, or None for nothing.
+        All the results pick up their next row point together, so the
+        additions can stay affine and share one inversion per row.'''
+        rows = cls.get()
+        coefficients = [coefficient % N for coefficient in coefficients]
+        if cls.window == 8:
+            # a byte per row, which is much quicker to pull out
+            digits = [k.to_bytes(32, 'little') for k in coefficients]
+        else:
+            mask = (1 << cls.window) - 1
+            digits = [
+                [(k >> (cls.window * i)) & mask for i in range(len(rows))]
+                for k in coefficients]
+        results = [offset] * len(coefficients)
+        for i, row in enumerate(rows):
+            pending = []
+            dxs = []
+            for j, k_digits in enumerate(digits):
+                digit = k_digits[i]
+                if not digit:
+                    continue
+                q = row[digit]
+                current = results[j]
+                if current is None:
+                    results[j] = q
+                elif current[0] == q[0]:
+                    # doubling or cancelling out, which affine addition
+                    # can't do, but it almost never happens
+                    total = jacobian_add((current[0], current[1], 1), (q[0], q[1], 1))
+                    results[j] = None if total[2] == 0 else jacobian_to_affine(total)
+                else:
+                    pending.append((j, q))
+                    dxs.append(q[0] - current[0])
+            for (j, (x2, y2)), inverse in zip(pending, batch_inverse(dxs, P)):
+                x1, y1 = results[j]
+                # slope of the line through the two points
+                s = (y2 - y1) * inverse % P
+                x3 = (s * s - x1 - x2) % P
+                results[j] = (x3, (s * (x1 - x3) - y1) % P)
+        return results
+
+    @classmethod
+    def glv_terms(cls, coefficient):
+        '''Returns the strauss() terms for coefficient * G, using a wider
+        window than we can afford for points that aren't reused'''
+        if cls.odd_table is None:
+            base = (G.x.num, G.y.num, 1)
+            cls.odd_table = [
+                (x, y, 1) for x, y in
+                jacobian_to_affine_batch(odd_multiples(base, cls.wnaf_width))]
+            cls.endo_table = endomorphism_table(cls.odd_table)
+        return glv_terms(
+            coefficient, cls.odd_table, cls.wnaf_width, cls.endo_table)
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, 'r') as f:
+            disk_table = json.loads(f.read())
+        if disk_table['window'] != cls.window:
+            raise ValueError('table has window {}, expected {}'.format(
+                disk_table['window'], cls.window))
+        rows = []
+        for raw_row in disk_table['rows']:
+            row = [None]
+            for raw_point in raw_row:
+                x = int(raw_point[:64], 16)
+                y = int(raw_point[64:], 16)
+                # make sure nothing on disk puts us off the curve
+                if (y * y - x * x * x - B) % P != 0:
+                    raise ValueError('({}, {}) is not on the curve'.format(x, y))
+                row.append((x, y))
+            rows.append(row)
+        cls.check(rows)
+        cls.rows = rows
+
+    @classmethod
+    def check(cls, rows):
+        '''Raises ValueError unless rows is laid out the way build() lays
+        it out. Every point being on the curve isn't enough: a point in the
+        wrong place would make secret * G silently wrong from then on.'''
+        size = 1 << cls.window
+        if len(rows) != len(range(0, 256, cls.window)):
+            raise ValueError('table has {} rows, expected {}'.format(
+                len(rows), len(range(0, 256, cls.window))))
+        for i, row in enumerate(rows):
+            if len(row) != size:
+                raise ValueError('row {} has {} points, expected {}'.format(
+                    i, len(row) - 1, size - 1))
+        if rows[0][1] != (G.x.num, G.y.num):
+            raise ValueError('table does not start with G')
+        # each point is the one before it plus the row's base, and the
+        # last one plus the base is the next row's base
+        checks = []
+        for i, row in enumerate(rows):
+            following = row[2:]
+            if i + 1 < len(rows):
+                following.append(rows[i + 1][1])
+            for j, want in enumerate(following, 1):
+                checks.append((i, row[j], row[1], want))
+        denominators = []
+        for i, (x1, y1), (x2, y2), want in checks:
+            if x1 != x2:
+                denominators.append(x2 - x1)
+            elif y1 == y2 and y1:
+                # the first addition in each row is a doubling
+                denominators.append(2 * y1)
+            else:
+                raise ValueError('row {} adds up to the point at infinity'.format(i))
+        for (i, (x1, y1), (x2, y2), want), inverse in zip(
+                checks, batch_inverse(denominators, P)):
+            if x1 != x2:
+                s = (y2 - y1) * inverse % P
+            else:
+                s = 3 * x1 * x1 * inverse % P
+            x3 = (s * s - x1 - x2) % P
+            if (x3, (s * (x1 - x3) - y1) % P) != want:
+                raise ValueError('row {} has a point in the wrong place'.format(i))
+
+    @classmethod
+    def dump(cls, filename):
+        with open(filename, 'w') as f:
+            to_dump = {
+                'window': cls.window,
+                'rows': [
+                    ['{:064x}{:064x}'.format(x, y) for x, y in row[1:]]
+                    for row in cls.get()
+                ],
+            }
+            f.write(json.dumps(to_dump))
+
+
+class WideGeneratorTable(GeneratorTable):
+    '''A GeneratorTable with a byte of the coefficient per row: 32 rows of
+    255 points. It takes a moment to build and about a megabyte to keep,
+    but needs half the additions, which pays off when deriving thousands
+    of keys with multiply_batch.'''
+    window = 8
+    rows = None
+
+
+def wnaf(coefficient, width):
+    '''Returns the width-w non-adjacent form of the coefficient, least
+    significant digit first. Each digit is either 0 or odd with absolute
+    value below 2**(width-1), and any two non-zero digits are at least
+    width places apart.'''
+    digits = []
+    while coefficient:
+        if coefficient & 1:
+            digit = coefficient & ((1 << width) - 1)
+            if digit >= 1 << (width - 1):
+                digit -= 1 << width
+            coefficient -= digit
+        else:
+            digit = 0
+        digits.append(digit)
+        coefficient >>= 1
+    return digits
+
+
+def odd_multiples(p, width):
+    '''Returns [p, 3p, 5p, ..., (2**(width-1) - 1)p] in Jacobian coordinates'''
+    double = jacobian_double(p)
+    result = [p]
+    for _ in range(1, 1 << (width - 2)):
+        result.append(jacobian_add(result[-1], double))
+    return result
+
+
+# secp256k1 has an efficiently computable endomorphism:
+# (x, y) -> (BETA*x, y) is the same as multiplying the point by LAMBDA
+BETA = 0x7ae96a2b657c07106e64479eac3434e99cf0497512f58995c1396c28719501ee
+LAMBDA = 0x5363ad4cc05c30e0a5261c028812645a122e22ea20816678df02967c1b23bd72
+# short basis vectors (A1, B1), (A2, B2) of the lattice of pairs (a, b)
+# with a + b*LAMBDA == 0 mod N, used to split scalars (GLV method)
+A1 = 0x3086d221a7d46bcde86c90e49284eb15
+B1 = -0xe4437ed6010e88286f547fa90abfe4c3
+A2 = 0x114ca50f7a8e2f3f657c1108d9d44cfd8
+B2 = 0x3086d221a7d46bcde86c90e49284eb15
+
+
+def glv_split(coefficient):
+    '''Returns k1, k2 with coefficient == k1 + k2*LAMBDA mod N, where
+    k1 and k2 are (possibly negative) integers of about 128 bits'''
+    # round to the closest lattice vector
+    c1 = (B2 * coefficient + N // 2) // N
+    c2 = (-B1 * coefficient + N // 2) // N
+    k1 = coefficient - c1 * A1 - c2 * A2
+    k2 = -c1 * B1 - c2 * B2
+    return k1, k2
+
+
+def endomorphism_table(table):
+    '''Applies the endomorphism to every point in a Jacobian table.
+    Since x = X/Z**2, multiplying X by BETA is enough.'''
+    return [(BETA * x % P, y, z) for x, y, z in table]
+
+
+def glv_terms(coefficient, table, width, endo_table=None):
+    '''Returns the two strauss() terms for coefficient * p, where
+    table is odd_multiples(p, width)'''
+    if endo_table is None:
+        endo_table = endomorphism_table(table)
+    k1, k2 = glv_split(coefficient)
+    return [
+        (wnaf(k1, width), table),
+        (wnaf(k2, width), endo_table),
+    ]
+
+
+def strauss(terms):
+    '''Takes a list of (wnaf digits, odd multiples table) terms and returns
+    the sum of all the products as a Jacobian triple. The doublings are
+    shared between all the terms, so adding a term costs only additions.'''
+    result = INFINITY
+    length = max([len(digits) for digits, _ in terms], default=0)
+    for i in reversed(range(length)):
+        result = jacobian_double(result)
+        for digits, table in terms:
+            if i >= len(digits):
+                continue
+            digit = digits[i]
+            if digit > 0:
+                result = jacobian_add(result, table[digit >> 1])
+            elif digit < 0:
+                # subtracting means adding the negation (x, -y)
+                x, y, z = table[-digit >> 1]
+                result = jacobian_add(result, (x, P - y, z))
+    return result
+
+
+def strauss_mul(scalars, points):
+    '''Returns the sum of scalar * point over the two lists as an S256Point,
+    evaluated in a single pass of doublings (Shamir's trick)'''
+    terms = []
+    for scalar, point in zip(scalars, points):
+        if point.x is None:
+            continue
+        terms.extend(point._glv_terms(scalar % N))
+    return from_jacobian(strauss(terms))
+
+
+# below this many terms Strauss is faster than Pippenger
+PIPPENGER_THRESHOLD = 48
+
+
+def pippenger(pairs):
+    '''Takes a list of (scalar, (x, y)) and returns the sum of the products
+    as a Jacobian triple using the bucket method (Pippenger). Each window
+    of every scalar costs one addition into a bucket, and the buckets are
+    then combined with a running sum.'''
+    # split every scalar with the endomorphism, which doubles the number
+    # of terms but halves the number of windows
+    terms = []
+    for scalar, (x, y) in pairs:
+        k1, k2 = glv_split(scalar)
+        for k, point_x in ((k1, x), (k2, BETA * x % P)):
+            if k < 0:
+                terms.append((-k, (point_x, P - y, 1)))
+            elif k > 0:
+                terms.append((k, (point_x, y, 1)))
+    if not terms:
+        return INFINITY
+    # wider windows mean fewer rounds but more buckets to combine
+    width = max(2, len(terms).bit_length() * 2 // 3)
+    mask = (1 << width) - 1
+    bits = max(k.bit_length() for k, _ in terms)
+    result = INFINITY
+    for shift in reversed(range(0, bits, width)):
+        for _ in range(width):
+            result = jacobian_double(result)
+        buckets = [INFINITY] * (mask + 1)
+        for k, point in terms:
+            digit = (k >> shift) & mask
+            if digit:
+                buckets[digit] = jacobian_add(buckets[digit], point)
+        # running holds buckets[digit] + ... + buckets[mask], so adding
+        # it up once per digit counts each bucket digit times
+        running = INFINITY
+        total = INFINITY
+        for digit in range(mask, 0, -1):
+            running = jacobian_add(running, buckets[digit])
+            total = jacobian_add(total, running)
+        result = jacobian_add(result, total)
+    return result
+
+
+def multi_scalar_mul(scalars, points):
+    '''Returns the sum of scalar * point over the two lists as an
+    S256Point, using Strauss for a few terms and Pippenger for many'''
+    if len(points) < PIPPENGER_THRESHOLD:
+        return strauss_mul(scalars, points)
+    pairs = []
+    for scalar, point in zip(scalars, points):
+        if point.x is None:
+            continue
+        pairs.append((scalar % N, (point.x.num, point.y.num)))
+    return from_jacobian(pippenger(pairs))
+
+
+class GeneratorTableTest(TestCase):
+
+    def test_multiply(self):
+        for secret in (1, 15, 16, 2**128, N - 1, randint(0, N)):
+            want = Point.__rmul__(G, secret)
+            self.assertEqual(from_jacobian(GeneratorTable.multiply(secret)), want)
+            self.assertEqual(secret * G, want)
+
+    def test_dump_load(self):
+        rows = GeneratorTable.get()
+        with TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'g.table')
+            GeneratorTable.dump(filename)
+            GeneratorTable.rows = None
+            GeneratorTable.load(filename)
+        self.assertEqual(GeneratorTable.rows, rows)
+
+    def test_load_tampered(self):
+        rows = GeneratorTable.get()
+        swapped = [list(row) for row in rows]
+        swapped[3][5], swapped[3][6] = swapped[3][6], swapped[3][5]
+        # every point is still on the curve, just not where it belongs
+        for tampered in (swapped, rows[:-1], rows[:5] + [rows[5][:-1]] + rows[6:]):
+            with TemporaryDirectory() as tmpdir:
+                filename = os.path.join(tmpdir, 'g.table')
+                GeneratorTable.rows = tampered
+                try:
+                    GeneratorTable.dump(filename)
+                finally:
+                    GeneratorTable.rows = rows
+                with self.assertRaises(ValueError):
+                    GeneratorTable.load(filename)
+            self.assertIs(GeneratorTable.rows, rows)
+
+    def test_multiply_batch(self):
+        secrets = [0, 1, 2, 255, 256, 2**128, N - 1, N, randint(0, N)]
+        want = [None if s % N == 0 else Point.__rmul__(G, s) for s in secrets]
+        g = (G.x.num, G.y.num)
+        for table in (GeneratorTable, WideGeneratorTable):
+            got = table.multiply_batch(secrets)
+            self.assertEqual([from_jacobian((*xy, 1)) if xy else None for xy in got], want)
+            # adding G runs into doubling G and G + -G
+            got = table.multiply_batch([1, N - 1, 5], offset=g)
+            self.assertEqual(got[0], ((2 * G).x.num, (2 * G).y.num))
+            self.assertIsNone(got[1])
+            self.assertEqual(got[2], ((6 * G).x.num, (6 * G).y.num))
+
+
+class NormalizeBatchTest(TestCase):
+
+    def test_normalize_batch(self):
+        points = [INFINITY]
+        current = (G.x.num, G.y.num, 1)
+        for _ in range(10):
+            points.append(current)
+            current = jacobian_double(jacobian_add(current, points[1]))
+        want = [from_jacobian(p) for p in points]
+        self.assertEqual(normalize_batch(points), want)
+        self.assertEqual(normalize_batch([]), [])
+
+
+class StraussTest(TestCase):
+
+    def test_wnaf(self):
+        for width in (2, 5, 8):
+            for coefficient in (1, 7, -7, 2**255, -2**128, randint(0, N)):
+                digits = wnaf(coefficient, width)
+                total = sum(d << i for i, d in enumerate(digits))
+                self.assertEqual(total, coefficient)
+                for d in digits:
+                    self.assertTrue(d == 0 or (d % 2 == 1 and abs(d) < 2**(width - 1)))
+
+    def test_strauss_mul(self):
+        point = 12345 * G
+        for u, v in ((0, 1), (1, 0), (randint(0, N), randint(0, N)), (N - 1, N - 1)):
+            want = u * G + v * point
+            self.assertEqual(strauss_mul([u, v], [G, point]), want)
+        self.assertIsNone(strauss_mul([1, N - 1], [point, point]).x)
+        self.assertIsNone(strauss_mul([], []).x)
+
+
+class MultiScalarMulTest(TestCase):
+
+    def test_multi_scalar_mul(self):
+        for count in (0, 3, PIPPENGER_THRESHOLD, 70):
+            scalars = [randint(0, N) for _ in range(count)]
+            points = [randint(1, N) * G for _ in range(count)]
+            if count:
+                # repeated points, G, zero and the point at infinity
+                scalars[:4] = [N - 1, 0, 5, 7]
+                points[:4] = [G, points[-1], S256Point(None, None), points[-1]]
+            want = S256Point(None, None)
+            for scalar, point in zip(scalars, points):
+                want += scalar * point
+            self.assertEqual(multi_scalar_mul(scalars, points), want)
+            pairs = [(s % N, (p.x.num, p.y.num)) for s, p in zip(scalars, points) if p.x is not None]
+            self.assertEqual(from_jacobian(pippenger(pairs)), want)
+
+
+class GLVTest(TestCase):
+
+    def test_endomorphism(self):
+        point = LAMBDA * G
+        self.assertEqual(point, S256Point(BETA * G.x.num % P, G.y.num))
+
+    def test_split(self):
+        for coefficient in (0, 1, LAMBDA, N - 1, 2**255, randint(0, N)):
+            k1, k2 = glv_split(coefficient)
+            self.assertEqual((k1 + k2 * LAMBDA) % N, coefficient)
+            self.assertTrue(abs(k1).bit_length() <= 129)
+            self.assertTrue(abs(k2).bit_length() <= 129)
+
+    def test_rmul(self):
+        point = S256Point(
+            0x887387e452b8eacc4acfde10d9aaf7f6d9a0f975aabb10d006e4da568744d06c,
+            0x61de6d95231cd89026e286df3b6ae4a894a3378e393e93a0f45b666329a0ae34)
+        for coefficient in (1, LAMBDA, N - LAMBDA, 2**200 + 1, randint(0, N)):
+            want = Point.__rmul__(point, coefficient)
+            self.assertEqual(coefficient * point, want)
+            self.assertEqual(strauss_mul([coefficient], [G]), Point.__rmul__(G, coefficient))
+
+
 class S256Test(TestCase):
 
     def test_order(self):
         point = N * G
         self.assertIsNone(point.x)
 
+    def test_read_write_sec(self):
+        points = [randint(1, N) * G for _ in range(3)]
+        buf = bytearray(100 * len(points))
+        offset = 1
+        for point in points:
+            offset = write_sec(point, buf, offset, compressed=False)
+            end = write_sec(point, buf, offset)
+            self.assertEqual(bytes(buf[offset:end]), point.sec())
+            offset = end
+        offset = 1
+        for point in points:
+            for _ in range(2):
+                got, offset = read_sec(memoryview(buf), offset)
+                self.assertEqual(got, point)
+        with self.assertRaises(ValueError):
+            read_sec(points[0].sec()[:-1])
+        with self.assertRaises(ValueError):
+            read_sec(b'\x05' + bytes(32))
+        secs = [p.sec() for p in points] * 2
+        self.assertEqual(S256Point.parse_many(secs), points * 2)
+
+    def test_addition_chains(self):
+        for a in (1, 2, 7, P - 1, randint(1, P - 1), randint(1, P - 1)):
+            self.assertEqual(sqrt_p(a), pow(a, (P + 1) // 4, P))
+            self.assertEqual(inverse_p(a), pow(a, P - 2, P))
+            self.assertEqual(inverse_mod(a, P), pow(a, P - 2, P))
+        a = S256Field(randint(1, P - 1))
+        self.assertEqual(a.sqrt(), a**((P + 1) // 4))
+        self.assertEqual(a / a, S256Field(1))
+
     def test_pubpoint(self):
         # write a test that tests the public point for the following
         points = (
@@ -482,6 +1466,42 @@ class S256Test(TestCase):
             # check that the secret*G is the same as the point
             self.assertEqual(secret * G, point)
 
+    def test_rmul(self):
+        # the Jacobian fast path has to agree with the generic affine one
+        point = S256Point(
+            0x887387e452b8eacc4acfde10d9aaf7f6d9a0f975aabb10d006e4da568744d06c,
+            0x61de6d95231cd89026e286df3b6ae4a894a3378e393e93a0f45b666329a0ae34)
+        for coefficient in (1, 2, 3, N - 1, N + 5, randint(0, N)):
+            want = Point.__rmul__(point, coefficient % N)
+            self.assertEqual(coefficient * point, want)
+        self.assertIsNone((0 * point).x)
+
+    def test_unchecked(self):
+        point = S256Point.unchecked(G.x.num, G.y.num)
+        self.assertEqual(point, G)
+        self.assertEqual(point + point, Point.__add__(G, G))
+        other = 5 * G
+        self.assertEqual(point + other, Point.__add__(G, other))
+        self.assertEqual(other + point, 6 * G)
+        self.assertIsNone((other + (N - 5) * G).x)
+
+    def test_parse(self):
+        for point in (G, 42 * G, 4242 * G):
+            self.assertEqual(S256Point.parse(point.sec(compressed=True)), point)
+            self.assertEqual(S256Point.parse(point.sec(compressed=False)), point)
+        # x = 5 has no y on the curve
+        with self.assertRaises(ValueError):
+            S256Point.parse(b'\x02' + (5).to_bytes(32, 'big'))
+
+    def test_parse_cache(self):
+        sec = (31337 * G).sec()
+        parse_sec.cache_clear()
+        point = S256Point.parse(sec)
+        self.assertIs(S256Point.parse(bytearray(sec)), point)
+        info = parse_sec.cache_info()
+        self.assertEqual((info.hits, info.misses), (1, 1))
+        self.assertEqual(point, S256Point.parse_uncached(sec))
+
     def test_verify(self):
         point = S256Point(
             0x887387e452b8eacc4acfde10d9aaf7f6d9a0f975aabb10d006e4da568744d06c,
@@ -495,6 +1515,37 @@ class S256Test(TestCase):
         s = 0xc7207fee197d27c618aea621406f6bf5ef6fca38681d82b2f06fddbdce6feab6
         self.assertTrue(point.verify(z, Signature(r, s)))
 
+    def test_verify_table(self):
+        pk = PrivateKey(randint(1, N))
+        z = randint(0, 2**256)
+        sig = pk.sign(z)
+        point = S256Point.parse_uncached(pk.point.sec())
+        threshold = S256Point.table_threshold
+        for _ in range(threshold):
+            self.assertTrue(point.verify(z, sig))
+        self.assertIsNone(point._table)
+        self.assertTrue(point.verify(z, sig))
+        self.assertIsNotNone(point._table)
+        self.assertTrue(point.verify(z, sig))
+        self.assertFalse(point.verify(z + 1, sig))
+        self.assertEqual(12345 * point, 12345 * pk.point)
+        # no new tables once the budget is used up
+        budget = S256Point.table_budget
+        S256Point.table_budget = 0
+        try:
+            point = S256Point.parse_uncached(pk.point.sec())
+            for _ in range(threshold + 1):
+                self.assertTrue(point.verify(z, sig))
+            self.assertIsNone(point._table)
+            self.assertEqual(point._verify_count, TABLE_REFUSED)
+            # and it stays refused rather than asking again each time
+            S256Point.table_budget = budget
+            for _ in range(threshold + 1):
+                self.assertTrue(point.verify(z, sig))
+            self.assertIsNone(point._table)
+        finally:
+            S256Point.table_budget = budget
+
     def test_sec(self):
         coefficient = 999**3
         uncompressed = '049d5ca49670cbe4c3bfa84c96a8c87df086c6ea6a24ba6b809c9de234496808d56fa15cc7f3d38cda98dee2419f415b7513dde1301f8643cd9245aea7f3f911f9'
@@ -515,6 +1566,19 @@ class S256Test(TestCase):
         self.assertEqual(point.sec(compressed=False), bytes.fromhex(uncompressed))
         self.assertEqual(point.sec(compressed=True), bytes.fromhex(compressed))
 
+    def test_memoized_encodings(self):
+        point = 888**3 * G
+        self.assertIs(point.sec(), point.sec())
+        self.assertEqual(point.sec(compressed=False)[0], 4)
+        self.assertIs(point.hash160(), point.hash160())
+        self.assertIs(point.address(testnet=True), point.address(testnet=True))
+        self.assertNotEqual(point.address(testnet=True), point.address())
+        # points can be used as keys in a watch-list
+        watch = {point: 'deposit'}
+        self.assertEqual(watch[S256Point.parse(point.sec())], 'deposit')
+        self.assertNotIn(G, watch)
+        self.assertEqual(hash(point), hash(S256Point(point.x.num, point.y.num)))
+
     def test_address(self):
         secret = 888**3
         mainnet_address = '148dY81A9BmdpMhvYEVznrM45kWN32vSCN'
@@ -543,6 +1607,7 @@ class S256Test(TestCase):
 
 
 class Signature:
+    __slots__ = ('r', 's')
 
     def __init__(self, r, s):
         self.r = r
@@ -551,49 +1616,150 @@ class Signature:
     def __repr__(self):
         return 'Signature({:x},{:x})'.format(self.r, self.s)
 
+    def recover_candidates(self, z):
+        '''Returns the public keys this signature is valid for over z'''
+        return get_backend().recover(self, z)
+
+    def _recover_candidates(self, z):
+        '''The reference recovery that PythonBackend uses.
+        R, the point whose x coordinate is r, can be either of two points
+        for each possible x, and each R gives the key (s*R - z*G) / r.'''
+        if not (0 < self.r < N and 0 < self.s < N):
+            return []
+        r_inv = inverse_mod(self.r, N)
+        # -(z/r) * G is the same whatever R is
+        minus_zg = GeneratorTable.multiply(-z * r_inv % N)
+        u = self.s * r_inv % N
+        points = []
+        # x is r, or r + N as long as that's still less than P
+        for x in (self.r, self.r + N):
+            if x >= P:
+                break
+            try:
+                y = lift_x(x)
+            except ValueError:
+                continue
+            # (s/r)*R; (s/r)*(-R) is just its negation
+            ux, uy, uz = strauss(glv_terms(u, odd_multiples((x, y, 1), 5), 5))
+            points.append(jacobian_add((ux, uy, uz), minus_zg))
+            points.append(jacobian_add((ux, P - uy, uz), minus_zg))
+        return [point for point in normalize_batch(points) if point.x is not None]
+
     def der(self):
-        rbin = self.r.to_bytes(32, byteorder='big')
-        # remove all null bytes at the beginning
-        rbin = rbin.lstrip(b'\x00')
-        # if rbin has a high bit, add a \x00
-        if rbin[0] & 0x80:
-            rbin = b'\x00' + rbin
-        result = bytes([2, len(rbin)]) + rbin  # <1>
-        sbin = self.s.to_bytes(32, byteorder='big')
-        # remove all null bytes at the beginning
-        sbin = sbin.lstrip(b'\x00')
-        # if sbin has a high bit, add a \x00
-        if sbin[0] & 0x80:
-            sbin = b'\x00' + sbin
-        result += bytes([2, len(sbin)]) + sbin
-        return bytes([0x30, len(result)]) + result
+        rlength, slength = der_lengths(self)
+        # one join instead of concatenating the pieces one at a time
+        return b''.join((
+            bytes((0x30, 4 + rlength + slength, 2, rlength)),
+            self.r.to_bytes(rlength, 'big'),
+            bytes((2, slength)),
+            self.s.to_bytes(slength, 'big'),
+        ))
 
     @classmethod
     def parse(cls, signature_bin):
-        s = BytesIO(signature_bin)
-        compound = s.read(1)[0]
-        if compound != 0x30:
-            raise SyntaxError("Bad Signature")
-        length = s.read(1)[0]
-        if length + 2 != len(signature_bin):
+        sig, end = read_der(signature_bin)
+        if end != len(signature_bin):
             raise SyntaxError("Bad Signature Length")
-        marker = s.read(1)[0]
-        if marker != 0x02:
-            raise SyntaxError("Bad Signature")
-        rlength = s.read(1)[0]
-        r = int.from_bytes(s.read(rlength), 'big')
-        marker = s.read(1)[0]
-        if marker != 0x02:
+        return sig
+
+    @classmethod
+    def parse_many(cls, signatures):
+        '''Parses a list of DER signatures'''
+        return [cls.parse(signature_bin) for signature_bin in signatures]
+
+
+def der_lengths(sig):
+    '''Returns how many bytes r and s take in DER. A number whose top bit
+    is set needs a 0 byte in front so it isn't read as negative, and
+    (bit_length + 8) // 8 bytes always leaves room for that bit.'''
+    return (sig.r.bit_length() + 8) // 8, (sig.s.bit_length() + 8) // 8
+
+
+def read_der(buf, offset=0):
+    '''Parses the DER signature starting at offset in buf and returns
+    (signature, offset just past it). buf can be bytes, a bytearray or a
+    memoryview, say of a whole transaction; only r and s get copied.'''
+    try:
+        compound, length, marker, rlength = buf[offset:offset + 4]
+        s_marker = offset + 4 + rlength
+        s_start = s_marker + 2
+        if compound != 0x30 or marker != 0x02 or buf[s_marker] != 0x02:
             raise SyntaxError("Bad Signature")
-        slength = s.read(1)[0]
-        s = int.from_bytes(s.read(slength), 'big')
-        if len(signature_bin) != 6 + rlength + slength:
-            raise SyntaxError("Signature too long")
+        slength = buf[s_marker + 1]
+    except (ValueError, IndexError):
+        raise SyntaxError("Signature too short")
+    end = s_start + slength
+    if length != 4 + rlength + slength:
+        raise SyntaxError("Signature too long")
+    if end > len(buf):
+        raise SyntaxError("Bad Signature Length")
+    r = int.from_bytes(buf[offset + 4:s_marker], 'big')
+    s = int.from_bytes(buf[s_start:end], 'big')
+    return Signature(r, s), end
+
+
+def write_der(sig, buf, offset=0):
+    '''Writes the DER encoding of sig into buf (a bytearray or writable
+    memoryview with room for it) at offset and returns the offset just
+    past it'''
+    rlength, slength = der_lengths(sig)
+    s_marker = offset + 4 + rlength
+    end = s_marker + 2 + slength
+    if end > len(buf):
+        raise ValueError('No room for the signature')
+    buf[offset:offset + 4] = bytes((0x30, 4 + rlength + slength, 2, rlength))
+    buf[offset + 4:s_marker] = sig.r.to_bytes(rlength, 'big')
+    buf[s_marker:s_marker + 2] = bytes((2, slength))
+    buf[s_marker + 2:end] = sig.s.to_bytes(slength, 'big')
+    return end
+
+
+class SchnorrSignature:
+    '''A BIP340 signature: r is the x coordinate of the nonce point R
+    (whose y is even) and s is the scalar'''
+    __slots__ = ('r', 's')
+
+    def __init__(self, r, s):
+        self.r = r
+        self.s = s
+
+    def __repr__(self):
+        return 'SchnorrSignature({:x},{:x})'.format(self.r, self.s)
+
+    def __eq__(self, other):
+        return self.r == other.r and self.s == other.s
+
+    def serialize(self):
+        return self.r.to_bytes(32, 'big') + self.s.to_bytes(32, 'big')
+
+    @classmethod
+    def parse(cls, signature_bin):
+        if len(signature_bin) != 64:
+            raise ValueError('Schnorr signatures are 64 bytes')
+        r = int.from_bytes(signature_bin[:32], 'big')
+        s = int.from_bytes(signature_bin[32:], 'big')
         return cls(r, s)
 
 
+def schnorr_challenge(r, xonly, msg):
+    '''Returns the BIP340 challenge e for nonce x coordinate r, x-only
+    public key bytes and message'''
+    data = r.to_bytes(32, 'big') + xonly + msg
+    return int.from_bytes(tagged_hash('BIP0340/challenge', data), 'big') % N
+
+
 class SignatureTest(TestCase):
 
+    def test_recover_candidates(self):
+        for secret in (1, 12345, randint(1, N)):
+            pk = PrivateKey(secret)
+            z = randint(0, 2**256)
+            candidates = pk.sign(z).recover_candidates(z)
+            self.assertIn(pk.point, candidates)
+            for point in candidates:
+                self.assertTrue(point.verify(z, pk.sign(z)))
+        self.assertEqual(Signature(0, 1).recover_candidates(1), [])
+
     def test_der(self):
         testcases = (
             (1, 2),
@@ -606,23 +1772,75 @@ class SignatureTest(TestCase):
             sig2 = Signature.parse(der)
             self.assertEqual(sig2.r, r)
             self.assertEqual(sig2.s, s)
+        for bad in (b'', b'\x30', der[:-1], der + b'\x01', b'\x31' + der[1:]):
+            with self.assertRaises(SyntaxError):
+                Signature.parse(bad)
+
+    def test_read_write_der(self):
+        sigs = [Signature(randint(1, N), randint(1, N)) for _ in range(5)]
+        sigs.append(Signature(0x80, 0x7f))
+        buf = bytearray(80 * len(sigs))
+        offset = 3
+        for sig in sigs:
+            end = write_der(sig, buf, offset)
+            self.assertEqual(bytes(buf[offset:end]), sig.der())
+            offset = end
+        offset = 3
+        for sig in sigs:
+            got, offset = read_der(memoryview(buf), offset)
+            self.assertEqual((got.r, got.s), (sig.r, sig.s))
+        with self.assertRaises(ValueError):
+            write_der(sigs[0], bytearray(10))
+        parsed = Signature.parse_many([sig.der() for sig in sigs])
+        self.assertEqual([(s.r, s.s) for s in parsed], [(s.r, s.s) for s in sigs])
+
+
+def hmac_digest(keyed, message):
+    '''Returns the hmac of message using a copy of an hmac object that
+    already has its key (and possibly the start of the message) in it'''
+    h = keyed.copy()
+    h.update(message)
+    return h.digest()
 
 
 class PrivateKey:
 
     def __init__(self, secret):
         self.secret = secret
-        self.point = secret * G
+        self.point = get_backend().pubkey(secret)
+        self._k_context = None
 
     def hex(self):
         return '{:x}'.format(self.secret).zfill(64)
 
     def sign(self, z):
+        return get_backend().sign(self, z)
+
+    def _sign(self, z):
         k = self.deterministic_k(z)
         # r is the x coordinate of the resulting point k*G
         r = (k * G).x.num
-        # remember 1/k = pow(k, N-2, N)
-        k_inv = pow(k, N - 2, N)
+        # remember 1/k = pow(k, N-2, N), which inverse_mod finds faster
+        k_inv = inverse_mod(k, N)
+        return self._signature(z, r, k_inv)
+
+    def sign_many(self, zs):
+        '''Signs every z in zs, returning the same signatures as sign
+        would, in order. The k*G points are normalized with one inversion
+        and the k values are inverted with another.'''
+        return get_backend().sign_many(self, zs)
+
+    def _sign_many(self, zs):
+        '''The reference sign_many that PythonBackend uses'''
+        ks = [self.deterministic_k(z) for z in zs]
+        rs = jacobian_to_affine_batch([GeneratorTable.multiply(k) for k in ks])
+        k_invs = batch_inverse(ks, N)
+        return [
+            self._signature(z, r[0], k_inv)
+            for z, r, k_inv in zip(zs, rs, k_invs)
+        ]
+
+    def _signature(self, z, r, k_inv):
         # s = (z+r*secret) / k
         s = (z + r * self.secret) * k_inv % N
         if s > N / 2:
@@ -632,24 +1850,56 @@ class PrivateKey:
         return Signature(r, s)
 
     def deterministic_k(self, z):
-        k = b'\x00' * 32
         v = b'\x01' * 32
         if z > N:
             z -= N
         z_bytes = z.to_bytes(32, 'big')
-        secret_bytes = self.secret.to_bytes(32, 'big')
-        s256 = hashlib.sha256
-        k = hmac.new(k, v + b'\x00' + secret_bytes + z_bytes, s256).digest()
-        v = hmac.new(k, v, s256).digest()
-        k = hmac.new(k, v + b'\x01' + secret_bytes + z_bytes, s256).digest()
-        v = hmac.new(k, v, s256).digest()
+        if self._k_context is None:
+            # the first hmac has the all-zero key and a message that
+            # starts with v + b'\x00' + secret_bytes, which is the same
+            # for every signature, so we hash that part just once
+            secret_bytes = self.secret.to_bytes(32, 'big')
+            first = hmac.new(b'\x00' * 32, v + b'\x00' + secret_bytes, 'sha256')
+            self._k_context = (secret_bytes, first)
+        secret_bytes, first = self._k_context
+        k = hmac_digest(first, z_bytes)
+        # each key is used for more than one message, so set it up once
+        key = hmac.new(k, digestmod='sha256')
+        v = hmac_digest(key, v)
+        k = hmac_digest(key, v + b'\x01' + secret_bytes + z_bytes)
+        key = hmac.new(k, digestmod='sha256')
+        v = hmac_digest(key, v)
         while True:
-            v = hmac.new(k, v, s256).digest()
+            v = hmac_digest(key, v)
             candidate = int.from_bytes(v, 'big')
             if candidate >= 1 and candidate < N:
                 return candidate
-            k = hmac.new(k, v + b'\x00', s256).digest()
-            v = hmac.new(k, v, s256).digest()
+            k = hmac_digest(key, v + b'\x00')
+            key = hmac.new(k, digestmod='sha256')
+            v = hmac_digest(key, v)
+
+    def sign_schnorr(self, msg, aux=bytes(32)):
+        '''Returns a BIP340 SchnorrSignature of msg (bytes). aux is 32
+        bytes of auxiliary randomness mixed into the nonce; fresh random
+        bytes protect against side channels, but all zeros is still safe.'''
+        if self.point.x is None:
+            raise ValueError('Cannot sign with a zero secret')
+        # sign with whichever of secret, -secret has an even y point
+        d = self.secret % N
+        if self.point.y.num % 2 == 1:
+            d = N - d
+        xonly = self.point.xonly()
+        t = d ^ int.from_bytes(tagged_hash('BIP0340/aux', aux), 'big')
+        nonce = tagged_hash('BIP0340/nonce', t.to_bytes(32, 'big') + xonly + msg)
+        k = int.from_bytes(nonce, 'big') % N
+        if k == 0:
+            raise RuntimeError('Nonce is zero, try different aux')
+        r, y = jacobian_to_affine(GeneratorTable.multiply(k))
+        # same trick for the nonce, R has to have an even y
+        if y % 2 == 1:
+            k = N - k
+        e = schnorr_challenge(r, xonly, msg)
+        return SchnorrSignature(r, (k + e * d) % N)
 
     def wif(self, compressed=True, testnet=False):
         # convert the secret from integer to a 32-bytes in big endian using num.to_bytes(32, 'big')
@@ -676,6 +1926,29 @@ class PrivateKeyTest(TestCase):
         sig = pk.sign(z)
         self.assertTrue(pk.point.verify(z, sig))
 
+    def test_deterministic_k(self):
+        # RFC6979 test vector for secp256k1
+        z = int.from_bytes(hashlib.sha256(b'Satoshi Nakamoto').digest(), 'big')
+        want = 0x8f8a276c19f4149656b280621e358cce24f5f52542772691ee69063b74f15d15
+        self.assertEqual(PrivateKey(1).deterministic_k(z), want)
+        pk = PrivateKey(12345)
+        tests = (
+            (1, 0x210ee542ab778109a508938cf910ca31b37e815a52cc941ebceeb3c6c0a6a23a),
+            (2**256 - 1, 0x8555f46f97855797fa720c2783bf043609c5b96f2a17f5d74a2518e92c80aef3),
+            (0xdeadbeef, 0xbb13d533ffacfafaa78899a513e352a29f14852e05e3c6b6a89900ea93c726f6),
+        )
+        for z, want in tests:
+            self.assertEqual(pk.deterministic_k(z), want)
+
+    def test_sign_many(self):
+        pk = PrivateKey(randint(1, N))
+        zs = [randint(0, 2**256) for _ in range(5)]
+        sigs = pk.sign_many(zs)
+        for z, sig in zip(zs, sigs):
+            want = pk.sign(z)
+            self.assertEqual(sig.der(), want.der())
+        self.assertEqual(pk.sign_many([]), [])
+
     def test_wif(self):
         pk = PrivateKey(2**256 - 2**199)
         expected = 'L5oLkpV3aqBJ4BgssVAsax1iRa77G5CVYnv9adQ6Z87te7TyUdSC'
@@ -689,3 +1962,611 @@ class PrivateKeyTest(TestCase):
         pk = PrivateKey(0x1cca23de92fd1862fb5b76e5f4f50eb082165e5191e116c18ed1a6b24be6a53f)
         expected = 'cNYfWuhDpbNM1JWc3c6JTrtrFVxU4AGhUKgw5f93NP2QaBqmxKkg'
         self.assertEqual(pk.wif(compressed=True, testnet=True), expected)
+
+
+def find_invalid(items):
+    '''Takes a list of (point, z, sig) and returns the index of the first
+    one whose signature doesn't verify, or None if they all do'''
+    items = list(items)
+    # invert every s with a single exponentiation; an s out of range
+    # can't be inverted, so it stands in as 1 until its turn comes
+    s_invs = batch_inverse(
+        [sig.s if 0 < sig.s < N else 1 for _, _, sig in items], N)
+    # now check each one in order, stopping at the first failure
+    for i, ((point, z, sig), s_inv) in enumerate(zip(items, s_invs)):
+        if point.x is None or not (0 < sig.r < N and 0 < sig.s < N):
+            return i
+        u = z * s_inv % N
+        v = sig.r * s_inv % N
+        if not point._verify_uv(u, v, sig.r):
+            return i
+    return None
+
+
+def verify_batch(items):
+    '''Takes a list of (point, z, sig) and returns whether every
+    signature is valid. Use find_invalid to locate a bad one.'''
+    return get_backend().verify_batch(items)
+
+
+class VerifyBatchTest(TestCase):
+
+    def test_verify_batch(self):
+        items = []
+        for secret in (1, 2, 12345, randint(1, N)):
+            pk = PrivateKey(secret)
+            z = randint(0, 2**256)
+            items.append((pk.point, z, pk.sign(z)))
+        self.assertTrue(verify_batch(items))
+        self.assertTrue(verify_batch([]))
+        point, z, sig = items[2]
+        items[2] = (point, z + 1, sig)
+        self.assertFalse(verify_batch(items))
+        self.assertEqual(find_invalid(items), 2)
+        items[2] = (point, z, Signature(sig.r, 0))
+        self.assertEqual(find_invalid(items), 2)
+        # a bad signature comes before one that's out of range
+        point, z, sig = items[0]
+        items[0] = (point, z + 1, sig)
+        point, z, sig = items[3]
+        items[3] = (point, z, Signature(0, sig.s))
+        self.assertEqual(find_invalid(items), 0)
+
+
+def verify_schnorr_batch(items):
+    '''Takes a list of (point, msg, sig) with BIP340 signatures and
+    returns whether they are all valid, using one multi-scalar
+    multiplication. Each signature says s*G == R + e*P, so with random
+    weights a (the first one 1) the batch is valid if
+    (sum a*s)*G - sum a*R - sum (a*e)*P is the point at infinity.
+    A bad signature gets through only if it cancels out under weights
+    it can't know in advance.'''
+    scalars = [0]
+    points = [G]
+    total_s = 0
+    for i, (point, msg, sig) in enumerate(items):
+        if point.x is None or sig.r >= P or sig.s >= N:
+            return False
+        try:
+            y = lift_x(sig.r)
+        except ValueError:
+            return False
+        # R has the even y for x == r
+        if y % 2 == 1:
+            y = P - y
+        if i == 0:
+            a = 1
+        else:
+            a = int.from_bytes(os.urandom(32), 'big') % (N - 1) + 1
+        e = schnorr_challenge(sig.r, point.xonly(), msg)
+        # -a*e*P, flipping the sign when P is the odd y point
+        if point.y.num % 2 == 0:
+            e = N - e
+        total_s += a * sig.s
+        scalars += [N - a, a * e % N]
+        points += [S256Point.unchecked(sig.r, y), point]
+    scalars[0] = total_s % N
+    return multi_scalar_mul(scalars, points).x is None
+
+
+class SchnorrTest(TestCase):
+
+    # secret, aux, msg, x-only public key, signature from the BIP340 vectors
+    vectors = (
+        (3, '00' * 32, '00' * 32,
+         'f9308a019258c31049344f85f89d5229b531c845836f99b08601f113bce036f9',
+         'e907831f80848d1069a5371b402410364bdf1c5f8307b0084c55f1ce2dca8215'
+         '25f66a4a85ea8b71e482a74f382d2ce5ebeee8fdb2172f477df4900d310536c0'),
+        (0xb7e151628aed2a6abf7158809cf4f3c762e7160f38b4da56a784d9045190cfef,
+         '00' * 31 + '01',
+         '243f6a8885a308d313198a2e03707344a4093822299f31d0082efa98ec4e6c89',
+         'dff1d77f2a671c5f36183726db2341be58feae1da2deced843240f7b502ba659',
+         '6896bd60eeae296db48a229ff71dfe071bde413e6d43f917dc8dcf8c78de3341'
+         '8906d11ac976abccb20b091292bff4ea897efcb639ea871cfa95f6de339e4b0a'),
+    )
+
+    def test_vectors(self):
+        for secret, aux, msg, xonly, sig_hex in self.vectors:
+            pk = PrivateKey(secret)
+            msg = bytes.fromhex(msg)
+            self.assertEqual(pk.point.xonly().hex(), xonly)
+            sig = pk.sign_schnorr(msg, bytes.fromhex(aux))
+            self.assertEqual(sig.serialize().hex(), sig_hex)
+            self.assertEqual(SchnorrSignature.parse(sig.serialize()), sig)
+            point = S256Point.parse_xonly(bytes.fromhex(xonly))
+            self.assertTrue(point.verify_schnorr(msg, sig))
+            self.assertTrue(pk.point.verify_schnorr(msg, sig))
+            self.assertFalse(point.verify_schnorr(msg + b'\x00', sig))
+
+    def test_odd_y(self):
+        # keys with an odd y sign with the negated secret
+        parities = set()
+        for secret in (1, 2, 6, 9):
+            pk = PrivateKey(secret)
+            parities.add(pk.point.y.num % 2)
+            sig = pk.sign_schnorr(b'odd')
+            self.assertTrue(pk.point.verify_schnorr(b'odd', sig))
+            point = S256Point.parse_xonly(pk.point.xonly())
+            self.assertEqual(point.y.num % 2, 0)
+            self.assertTrue(point.verify_schnorr(b'odd', sig))
+        self.assertEqual(parities, {0, 1})
+
+    def test_invalid(self):
+        pk = PrivateKey(12345)
+        msg = b'schnorr'
+        sig = pk.sign_schnorr(msg)
+        point = pk.point
+        self.assertFalse(point.verify_schnorr(msg, SchnorrSignature(sig.r, N)))
+        self.assertFalse(point.verify_schnorr(msg, SchnorrSignature(P, sig.s)))
+        self.assertFalse(point.verify_schnorr(msg, SchnorrSignature(sig.r, sig.s + 1)))
+        with self.assertRaises(ValueError):
+            SchnorrSignature.parse(bytes(63))
+
+    def test_verify_schnorr_batch(self):
+        items = []
+        for secret in range(1, 60):
+            pk = PrivateKey(secret * 7919)
+            msg = secret.to_bytes(4, 'big')
+            items.append((pk.point, msg, pk.sign_schnorr(msg)))
+        self.assertTrue(verify_schnorr_batch([]))
+        self.assertTrue(verify_schnorr_batch(items[:3]))
+        self.assertTrue(verify_schnorr_batch(items))
+        point, msg, sig = items[40]
+        items[40] = (point, msg + b'\x00', sig)
+        self.assertFalse(verify_schnorr_batch(items))
+        self.assertFalse(verify_schnorr_batch(items[38:42]))
+        items[40] = (point, msg, SchnorrSignature(sig.r, N - sig.s))
+        self.assertFalse(verify_schnorr_batch(items))
+
+
+def derive_addresses(secrets, compressed=True, testnet=False, chunk_size=1024):
+    '''Takes an iterable of secrets and yields (secret, sec, h160, address)
+    for each one. A secret that is one more than the previous one costs
+    just one point addition, and points are converted to affine a chunk
+    at a time with a single inversion.'''
+    if testnet:
+        prefix = b'\x6f'
+    else:
+        prefix = b'\x00'
+    g = (G.x.num, G.y.num, 1)
+    chunk = []
+    previous_secret, previous_point = None, None
+    for secret in secrets:
+        if previous_secret is not None and secret == previous_secret + 1:
+            point = jacobian_add(previous_point, g)
+        else:
+            point = GeneratorTable.multiply(secret % N)
+        previous_secret, previous_point = secret, point
+        chunk.append((secret, point))
+        if len(chunk) == chunk_size:
+            yield from address_chunk(chunk, compressed, prefix)
+            chunk = []
+    yield from address_chunk(chunk, compressed, prefix)
+
+
+def address_chunk(chunk, compressed, prefix):
+    '''Helper for derive_addresses that normalizes a list of
+    (secret, Jacobian point) and yields the encodings'''
+    affine = jacobian_to_affine_batch([point for _, point in chunk])
+    for (secret, _), xy in zip(chunk, affine):
+        if xy is None:
+            raise ValueError('secret {} is a multiple of N'.format(secret))
+        x, y = xy
+        if compressed:
+            sec = bytes([2 + (y & 1)]) + x.to_bytes(32, 'big')
+        else:
+            sec = b'\x04' + x.to_bytes(32, 'big') + y.to_bytes(32, 'big')
+        h160 = hash160(sec)
+        yield secret, sec, h160, encode_base58_checksum(prefix + h160)
+
+
+class DeriveAddressesTest(TestCase):
+
+    def test_derive_addresses(self):
+        secrets = [1, 2, 3, 4, 888**3, 888**3 + 1, 5, N - 1, 2**200]
+        for compressed, testnet in ((True, False), (False, True)):
+            results = list(derive_addresses(
+                secrets, compressed=compressed, testnet=testnet, chunk_size=4))
+            self.assertEqual([r[0] for r in results], secrets)
+            for secret, sec, h160, address in results:
+                point = PrivateKey(secret).point
+                self.assertEqual(sec, point.sec(compressed))
+                self.assertEqual(h160, point.hash160(compressed))
+                self.assertEqual(address, point.address(compressed, testnet))
+        self.assertEqual(list(derive_addresses([])), [])
+        with self.assertRaises(ValueError):
+            list(derive_addresses([N]))
+
+
+def verify_job(job):
+    '''Verifies a (sec, der, z) job. This runs in the worker processes
+    of VerifyExecutor, so it takes raw bytes rather than objects.'''
+    sec, der, z = job
+    try:
+        point = S256Point.parse(sec)
+        sig = Signature.parse(der)
+    except (ValueError, SyntaxError, IndexError):
+        return False
+    return point.verify(z, sig)
+
+
+def init_verify_worker(backend=None):
+    '''Builds the G tables once in each worker process and switches it
+    to the parent's backend. The backend comes over as the object itself,
+    since a worker that was spawned rather than forked only has the
+    backends registered when this module is imported.'''
+    if backend is not None:
+        set_backend(backend)
+    GeneratorTable.get()
+    GeneratorTable.glv_terms(1)
+
+
+class VerifyExecutor:
+    '''Spreads signature verification over a pool of processes, which
+    use the backend that's current when the executor is made. That
+    backend gets pickled over to the workers, so it has to be picklable,
+    which means an instance of a class defined at the top level of a
+    module. mp_context picks how the workers start (Python 3.7+).'''
+
+    def __init__(self, max_workers=None, chunksize=16, mp_context=None):
+        self.chunksize = chunksize
+        backend = get_backend()
+        # find out now rather than with a broken pool on the first job
+        try:
+            pickle.dumps(backend)
+        except Exception as e:
+            raise TypeError('ecc backend {} cannot be sent to worker '
+                            'processes: {}'.format(backend.name, e))
+        kwargs = {}
+        if mp_context is not None:
+            kwargs['mp_context'] = mp_context
+        self.executor = ProcessPoolExecutor(
+            max_workers=max_workers, initializer=init_verify_worker,
+            initargs=(backend,), **kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+    def verify_many(self, jobs):
+        '''Takes a list of (sec, der, z) and returns a list of whether
+        each signature is valid, in the same order'''
+        return list(self.executor.map(verify_job, jobs, chunksize=self.chunksize))
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+
+class DeferredVerifier:
+    '''A verifier hook for op_checksig that queues the signature checks
+    instead of doing them, so they can all go to a VerifyExecutor at once.
+    It answers True for every non-empty signature, so Script.evaluate only
+    hands it checks where an invalid signature would fail the script
+    anyway, and any one invalid result makes finish() fail the whole
+    transaction.'''
+
+    def __init__(self):
+        self.jobs = []
+
+    def __call__(self, sec, der, z):
+        # an empty signature is how a script fails a check on purpose
+        if len(der) == 0:
+            return False
+        self.jobs.append((sec, der, z))
+        return True
+
+    def finish(self, executor):
+        '''Returns whether every queued signature is valid'''
+        return all(executor.verify_many(self.jobs))
+
+
+class VerifyExecutorTest(TestCase):
+
+    def test_verify_many(self):
+        jobs = []
+        for secret in (1, 12345, randint(1, N)):
+            pk = PrivateKey(secret)
+            z = randint(0, N)
+            jobs.append((pk.point.sec(), pk.sign(z).der(), z))
+        sec, der, z = jobs[1]
+        jobs.append((sec, der, z + 1))
+        jobs.append((sec, b'\x30', z))
+        with VerifyExecutor(max_workers=2, chunksize=2) as executor:
+            self.assertEqual(
+                executor.verify_many(jobs), [True, True, True, False, False])
+
+    def test_deferred_verifier(self):
+        pk = PrivateKey(12345)
+        z = randint(0, N)
+        verifier = DeferredVerifier()
+        self.assertTrue(verifier(pk.point.sec(), pk.sign(z).der(), z))
+        self.assertFalse(verifier(pk.point.sec(), b'', z))
+        with VerifyExecutor(max_workers=1) as executor:
+            self.assertTrue(verifier.finish(executor))
+            verifier(pk.point.sec(), pk.sign(z).der(), z + 1)
+            self.assertFalse(verifier.finish(executor))
+
+    def test_runtime_backend(self):
+        pk = PrivateKey(12345)
+        z = randint(0, N)
+        jobs = [(pk.point.sec(), pk.sign(z).der(), z),
+                (pk.point.sec(), pk.sign(z).der(), z + 1)]
+        previous = get_backend()
+        # a spawned worker only knows the backends registered on import
+        set_backend(CountingBackend())
+        try:
+            context = multiprocessing.get_context('spawn')
+            with VerifyExecutor(max_workers=1, mp_context=context) as executor:
+                self.assertEqual(executor.verify_many(jobs), [True, False])
+            unpicklable = CountingBackend()
+            unpicklable.calls = lambda: None
+            set_backend(unpicklable)
+            with self.assertRaises(TypeError):
+                VerifyExecutor(max_workers=1)
+        finally:
+            set_backend(previous)
+
+
+class PythonBackend:
+    '''The reference backend, which is this module's own pure-Python code.
+
+    A backend is any object with a name and these seven methods, taking
+    and returning this module's S256Point, Signature and PrivateKey
+    objects. PrivateKey, S256Point.verify, S256Point.parse,
+    Signature.recover_candidates and verify_batch all go through the
+    current backend, so the transaction and script code (multisig
+    included) gets whatever backend is selected without changes.
+    A new backend should pass BackendTest (subclass it and set backend).'''
+
+    name = 'python'
+
+    def pubkey(self, secret):
+        '''Returns secret * G as an S256Point'''
+        return secret * G
+
+    def sign(self, private_key, z):
+        '''Returns a low-s Signature of z by private_key'''
+        return private_key._sign(z)
+
+    def sign_many(self, private_key, zs):
+        '''Returns sign(private_key, z) for every z in zs, in order'''
+        if type(self).sign is not PythonBackend.sign:
+            # a subclass with its own sign has to have it called
+            return [self.sign(private_key, z) for z in zs]
+        return private_key._sign_many(zs)
+
+    def verify(self, point, z, sig):
+        '''Returns whether sig is a valid signature of z by point'''
+        return point._verify(z, sig)
+
+    def verify_batch(self, items):
+        '''Returns whether every (point, z, sig) in items is valid'''
+        return find_invalid(items) is None
+
+    def recover(self, sig, z):
+        '''Returns the public keys sig is a valid signature of z for'''
+        return sig._recover_candidates(z)
+
+    def parse_sec(self, sec_bin):
+        '''Returns the S256Point for SEC bytes, raising ValueError if they
+        aren't a point on the curve'''
+        # the same keys show up over and over, so go through the cache
+        return parse_sec(sec_bin)
+
+
+# name of the environment variable that picks the backend at startup
+BACKEND_ENV = 'ECC_BACKEND'
+BACKENDS = {}
+current_backend = None
+
+
+def register_backend(backend):
+    '''Makes backend selectable by its name'''
+    BACKENDS[backend.name] = backend
+    return backend
+
+
+def set_backend(backend):
+    '''Switches to a backend, given either its name or the backend itself
+    (which gets registered). Returns the backend that was in use, or
+    None if none had been picked yet. It doesn't go through get_backend,
+    so a bad ECC_BACKEND can still be fixed here at runtime.'''
+    global current_backend
+    if isinstance(backend, str):
+        if backend not in BACKENDS:
+            raise ValueError('Unknown ecc backend {}'.format(backend))
+        backend = BACKENDS[backend]
+    else:
+        register_backend(backend)
+    previous = current_backend
+    current_backend = backend
+    return previous
+
+
+def get_backend():
+    '''Returns the backend in use. The first call picks the one named by
+    the ECC_BACKEND environment variable, or the Python one.'''
+    global current_backend
+    if current_backend is None:
+        name = os.environ.get(BACKEND_ENV, PythonBackend.name)
+        if name not in BACKENDS:
+            raise ValueError('Unknown ecc backend {} in {}'.format(
+                name, BACKEND_ENV))
+        current_backend = BACKENDS[name]
+    return current_backend
+
+
+register_backend(PythonBackend())
+
+
+class BackendTest(TestCase):
+    '''Conformance tests every backend has to pass. To check a new one,
+    subclass this and set backend to an instance of it.'''
+
+    backend = PythonBackend()
+
+    def test_pubkey(self):
+        keys = (
+            (7, 0x5cbdf0646e5db4eaa398f365f2ea7a0e3d419b7e0330e39ce92bddedcac4f9bc, 0x6aebca40ba255960a3178d6d861a54dba813d0b813fde7b5a5082628087264da),
+            (2**128, 0x8f68b9d2f63b5f339239c1ad981f162ee88c5678723ea3351b7b444c9ec4c0da, 0x662a9f2dba063986de1d90c2b6be215dbbea2cfe95510bfdf23cbf79501fff82),
+        )
+        for secret, x, y in keys:
+            self.assertEqual(self.backend.pubkey(secret), S256Point(x, y))
+        secret = randint(1, N - 1)
+        self.assertEqual(self.backend.pubkey(secret), secret * G)
+
+    def test_sign_verify(self):
+        for secret in (1, 12345, randint(1, N - 1)):
+            pk = PrivateKey(secret)
+            z = randint(0, 2**256)
+            sig = self.backend.sign(pk, z)
+            self.assertTrue(0 < sig.r < N and 0 < sig.s <= N // 2)
+            # signatures have to check out with the reference code too
+            self.assertTrue(pk.point._verify(z, sig))
+            self.assertTrue(self.backend.verify(pk.point, z, sig))
+            self.assertFalse(self.backend.verify(pk.point, z + 1, sig))
+            other = self.backend.pubkey(secret + 1)
+            self.assertFalse(self.backend.verify(other, z, sig))
+            self.assertFalse(self.backend.verify(pk.point, z, Signature(sig.r, 0)))
+
+    def test_sign_many(self):
+        pk = PrivateKey(randint(1, N - 1))
+        zs = [0, 1, randint(0, 2**256), randint(0, 2**256)]
+        sigs = self.backend.sign_many(pk, zs)
+        self.assertEqual([sig.der() for sig in sigs],
+                         [self.backend.sign(pk, z).der() for z in zs])
+        self.assertEqual(self.backend.sign_many(pk, []), [])
+
+    def test_verify_batch(self):
+        items = []
+        for secret in (2, 3, randint(1, N - 1)):
+            pk = PrivateKey(secret)
+            z = randint(0, 2**256)
+            items.append((pk.point, z, pk._sign(z)))
+        self.assertTrue(self.backend.verify_batch(items))
+        self.assertTrue(self.backend.verify_batch([]))
+        point, z, sig = items[1]
+        items[1] = (point, z, Signature(sig.r, N - sig.s + 1))
+        self.assertFalse(self.backend.verify_batch(items))
+
+    def test_parse_sec(self):
+        point = randint(1, N - 1) * G
+        for compressed in (True, False):
+            sec = point.sec(compressed)
+            self.assertEqual(self.backend.parse_sec(sec), point)
+        with self.assertRaises(ValueError):
+            self.backend.parse_sec(b'\x02' + P.to_bytes(32, 'big'))
+        with self.assertRaises(ValueError):
+            self.backend.parse_sec(b'\x04' + bytes(64))
+
+    def test_recover(self):
+        for secret in (1, 12345, randint(1, N - 1)):
+            pk = PrivateKey(secret)
+            z = randint(0, 2**256)
+            sig = pk._sign(z)
+            points = self.backend.recover(sig, z)
+            self.assertIn(pk.point, points)
+            for point in points:
+                self.assertTrue(point._verify(z, sig))
+        self.assertEqual(self.backend.recover(Signature(0, 1), 1), [])
+
+
+class CountingBackend(PythonBackend):
+    '''The Python backend, keeping count of the calls to it'''
+
+    name = 'counting'
+
+    def __init__(self):
+        self.calls = []
+
+    def pubkey(self, secret):
+        self.calls.append('pubkey')
+        return super().pubkey(secret)
+
+    def sign(self, private_key, z):
+        self.calls.append('sign')
+        return super().sign(private_key, z)
+
+    def sign_many(self, private_key, zs):
+        self.calls.append('sign_many')
+        return super().sign_many(private_key, zs)
+
+    def verify(self, point, z, sig):
+        self.calls.append('verify')
+        return super().verify(point, z, sig)
+
+    def verify_batch(self, items):
+        self.calls.append('verify_batch')
+        return super().verify_batch(items)
+
+    def recover(self, sig, z):
+        self.calls.append('recover')
+        return super().recover(sig, z)
+
+    def parse_sec(self, sec_bin):
+        self.calls.append('parse_sec')
+        return super().parse_sec(sec_bin)
+
+
+class BackendRegistryTest(TestCase):
+
+    def test_set_backend(self):
+        backend = CountingBackend()
+        previous = get_backend()
+        set_backend(backend)
+        try:
+            self.assertIs(get_backend(), backend)
+            pk = PrivateKey(12345)
+            sig = pk.sign(1)
+            point = S256Point.parse(pk.point.sec())
+            point.verify(1, sig)
+            verify_batch([(point, 1, sig)])
+            self.assertEqual(
+                backend.calls,
+                ['pubkey', 'sign', 'parse_sec', 'verify', 'verify_batch'])
+            # CountingBackend has its own sign, so sign_many has to use it
+            del backend.calls[:]
+            pk.sign_many([1, 2])
+            self.assertEqual(backend.calls, ['sign_many', 'sign', 'sign'])
+        finally:
+            set_backend(previous)
+        self.assertIs(set_backend('python'), previous)
+        with self.assertRaises(ValueError):
+            set_backend('no-such-backend')
+
+    def test_bad_environment(self):
+        global current_backend
+        previous, current_backend = current_backend, None
+        saved = os.environ.get(BACKEND_ENV)
+        os.environ[BACKEND_ENV] = 'no-such-backend'
+        try:
+            with self.assertRaises(ValueError):
+                get_backend()
+            self.assertIsNone(set_backend('python'))
+            self.assertIs(get_backend(), BACKENDS['python'])
+        finally:
+            if saved is None:
+                del os.environ[BACKEND_ENV]
+            else:
+                os.environ[BACKEND_ENV] = saved
+            current_backend = previous
+
+    def test_multisig(self):
+        # op imports this module, so import it here instead of at the top
+        from op import op_checkmultisig
+        z = 0xe71bfa115715d6fd33796948126f40a8cdd39f187e4afb03896795189fe1423c
+        sig1 = bytes.fromhex('3045022100dc92655fe37036f47756db8102e0d7d5e28b3beb83a8fef4f5dc0559bddfb94e02205a36d4e4e6c7fcd16658c50783e00c341609977aed3ad00937bf4ee942a8993701')
+        sig2 = bytes.fromhex('3045022100da6bee3c93766232079a01639d07fa869598749729ae323eab8eef53577d611b02207bef15429dcadce2121ea07f233115c6f09034c0be68db99980b9a6c5e75402201')
+        sec1 = bytes.fromhex('022626e955ea6ea6d98850c994f9107b036b1334f18ca8830bfff1295d21cfdb70')
+        sec2 = bytes.fromhex('03b287eaf122eea69030a0e9feed096bed8045c8b98bec453e1ffac7fbdbd4bb71')
+        backend = CountingBackend()
+        previous = get_backend()
+        set_backend(backend)
+        try:
+            stack = [b'', sig1, sig2, b'\x02', sec1, sec2, b'\x02']
+            self.assertTrue(op_checkmultisig(stack, z))
+            self.assertEqual(backend.calls, ['recover', 'recover'])
+        finally:
+            set_backend(previous)
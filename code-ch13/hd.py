@@ -0,0 +1,265 @@
+from unittest import TestCase
+
+import hmac
+
+from ecc import (
+    hmac_digest,
+    N,
+    PrivateKey,
+    S256Point,
+    WideGeneratorTable,
+)
+from helper import decode_base58_checksum, encode_base58_checksum
+
+
+# child numbers from here on are hardened: they can only be derived
+# from a private key
+HARDENED = 0x80000000
+
+# version bytes at the start of a serialized extended key
+MAINNET_PRIVATE = bytes.fromhex('0488ade4')
+MAINNET_PUBLIC = bytes.fromhex('0488b21e')
+TESTNET_PRIVATE = bytes.fromhex('04358394')
+TESTNET_PUBLIC = bytes.fromhex('043587cf')
+
+
+class ExtendedKey:
+    '''A BIP32 extended key: a public key (and secret, for a private
+    extended key) plus a chain code, which together derive child keys.'''
+    __slots__ = (
+        'point', 'chain_code', 'secret', 'depth', 'parent_fingerprint',
+        'child_number', 'testnet', '_fingerprint',
+    )
+
+    def __init__(self, point, chain_code, secret=None, depth=0,
+                 parent_fingerprint=b'\x00\x00\x00\x00', child_number=0,
+                 testnet=False):
+        self.point = point
+        self.chain_code = chain_code
+        self.secret = secret
+        self.depth = depth
+        self.parent_fingerprint = parent_fingerprint
+        self.child_number = child_number
+        self.testnet = testnet
+        self._fingerprint = None
+
+    def __repr__(self):
+        return 'ExtendedKey(depth={}, child={}, fingerprint={})'.format(
+            self.depth, self.child_number, self.fingerprint().hex())
+
+    @classmethod
+    def from_seed(cls, seed, testnet=False):
+        '''Returns the master private key for a seed (bytes)'''
+        digest = hmac.new(b'Bitcoin seed', seed, 'sha512').digest()
+        secret = int.from_bytes(digest[:32], 'big')
+        if not 0 < secret < N:
+            raise ValueError('Seed gives an invalid master key, use another')
+        point = PrivateKey(secret).point
+        return cls(point, digest[32:], secret=secret, testnet=testnet)
+
+    def is_private(self):
+        return self.secret is not None
+
+    def private_key(self):
+        if not self.is_private():
+            raise ValueError('Public extended keys have no private key')
+        return PrivateKey(self.secret)
+
+    def fingerprint(self):
+        '''The first 4 bytes of hash160 of the public key, which every
+        child carries to point back at its parent'''
+        if self._fingerprint is None:
+            self._fingerprint = self.point.hash160()[:4]
+        return self._fingerprint
+
+    def neuter(self):
+        '''Returns the public extended key, which can derive all the
+        non-hardened children's public keys but none of their secrets'''
+        return self.__class__(
+            self.point, self.chain_code, None, self.depth,
+            self.parent_fingerprint, self.child_number, self.testnet)
+
+    def child(self, index):
+        '''Returns the child key with the child number index'''
+        return self.children(index, 1)[0]
+
+    def children(self, start, count):
+        '''Returns the children with child numbers start to start+count-1.
+        Each child's public key is the parent's plus tweak * G, and all
+        of those are computed together by WideGeneratorTable.multiply_batch
+        instead of as a full secret * G each.'''
+        if start < 0 or start + count > 2**32:
+            raise ValueError('Child numbers go from 0 to 2**32 - 1')
+        if start + count > HARDENED and not self.is_private():
+            raise ValueError('Hardened children need a private key')
+        # the hmac key is the same for every child, so key it just once
+        keyed = hmac.new(self.chain_code, digestmod='sha512')
+        sec = self.point.sec()
+        if self.is_private():
+            secret_bytes = b'\x00' + self.secret.to_bytes(32, 'big')
+        tweaks = []
+        chain_codes = []
+        for index in range(start, start + count):
+            if index >= HARDENED:
+                data = secret_bytes + index.to_bytes(4, 'big')
+            else:
+                data = sec + index.to_bytes(4, 'big')
+            digest = hmac_digest(keyed, data)
+            tweak = int.from_bytes(digest[:32], 'big')
+            if tweak >= N:
+                raise ValueError('Child {} is invalid, skip it'.format(index))
+            tweaks.append(tweak)
+            chain_codes.append(digest[32:])
+        points = WideGeneratorTable.multiply_batch(
+            tweaks, offset=(self.point.x.num, self.point.y.num))
+        fingerprint = self.fingerprint()
+        result = []
+        for i, (tweak, chain_code, xy) in enumerate(zip(tweaks, chain_codes, points)):
+            if xy is None:
+                raise ValueError('Child {} is invalid, skip it'.format(start + i))
+            if self.is_private():
+                secret = (self.secret + tweak) % N
+            else:
+                secret = None
+            result.append(self.__class__(
+                S256Point.unchecked(*xy), chain_code, secret, self.depth + 1,
+                fingerprint, start + i, self.testnet))
+        return result
+
+    def derive(self, path):
+        '''Returns the key at a path like "m/44'/0'/0'/0/7", where ' or h
+        marks a hardened child number'''
+        key = self
+        for part in path.split('/'):
+            if part in ('m', 'M', ''):
+                continue
+            if part[-1] in ("'", 'h', 'H'):
+                index = int(part[:-1]) + HARDENED
+            else:
+                index = int(part)
+            key = key.child(index)
+        return key
+
+    def address(self, compressed=True):
+        return self.point.address(compressed=compressed, testnet=self.testnet)
+
+    def serialize(self):
+        '''The 78 bytes of a BIP32 serialized key, private if this is one'''
+        if self.is_private():
+            version = TESTNET_PRIVATE if self.testnet else MAINNET_PRIVATE
+            key = b'\x00' + self.secret.to_bytes(32, 'big')
+        else:
+            version = TESTNET_PUBLIC if self.testnet else MAINNET_PUBLIC
+            key = self.point.sec()
+        return version + bytes([self.depth]) + self.parent_fingerprint \
+            + self.child_number.to_bytes(4, 'big') + self.chain_code + key
+
+    @classmethod
+    def parse(cls, key_string):
+        '''Returns the ExtendedKey for an xprv/xpub (or tprv/tpub) string'''
+        raw = decode_base58_checksum(key_string)
+        if len(raw) != 78:
+            raise ValueError('Extended keys are 78 bytes, got {}'.format(len(raw)))
+        version = raw[:4]
+        if version not in (MAINNET_PRIVATE, MAINNET_PUBLIC, TESTNET_PRIVATE, TESTNET_PUBLIC):
+            raise ValueError('Unknown version {}'.format(version.hex()))
+        testnet = version in (TESTNET_PRIVATE, TESTNET_PUBLIC)
+        depth = raw[4]
+        parent_fingerprint = raw[5:9]
+        child_number = int.from_bytes(raw[9:13], 'big')
+        chain_code = raw[13:45]
+        key = raw[45:]
+        if version in (MAINNET_PRIVATE, TESTNET_PRIVATE):
+            if key[0] != 0:
+                raise ValueError('Private key has to start with a 0 byte')
+            secret = int.from_bytes(key[1:], 'big')
+            if not 0 < secret < N:
+                raise ValueError('Private key out of range')
+            point = PrivateKey(secret).point
+        else:
+            secret = None
+            point = S256Point.parse(key)
+        return cls(point, chain_code, secret, depth, parent_fingerprint,
+                   child_number, testnet)
+
+    def xprv(self):
+        if not self.is_private():
+            raise ValueError('Public extended keys have no xprv')
+        return encode_base58_checksum(self.serialize())
+
+    def xpub(self):
+        return encode_base58_checksum(self.neuter().serialize())
+
+
+def scan(chain, is_used, gap_limit=20, batch_size=100):
+    '''Yields the children of chain (an account's receive or change key)
+    that is_used(child) says have been used, in order. Children are
+    derived a batch at a time, only as far as needed: the scan stops
+    after gap_limit unused children in a row.'''
+    index = 0
+    unused = 0
+    while index < HARDENED:
+        for child in chain.children(index, min(batch_size, HARDENED - index)):
+            if is_used(child):
+                unused = 0
+                yield child
+            else:
+                unused += 1
+                if unused >= gap_limit:
+                    return
+        index += batch_size
+
+
+class ExtendedKeyTest(TestCase):
+
+    def test_vector1(self):
+        master = ExtendedKey.from_seed(bytes.fromhex('000102030405060708090a0b0c0d0e0f'))
+        self.assertEqual(master.xprv(), 'xprv9s21ZrQH143K3QTDL4LXw2F7HEK3wJUD2nW2nRk4stbPy6cq3jPPqjiChkVvvNKmPGJxWUtg6LnF5kejMRNNU3TGtRBeJgk33yuGBxrMPHi')
+        self.assertEqual(master.xpub(), 'xpub661MyMwAqRbcFtXgS5sYJABqqG9YLmC4Q1Rdap9gSE8NqtwybGhePY2gZ29ESFjqJoCu1Rupje8YtGqsefD265TMg7usUDFdp6W1EGMcet8')
+        child = master.derive("m/0'")
+        self.assertEqual(child.xprv(), 'xprv9uHRZZhk6KAJC1avXpDAp4MDc3sQKNxDiPvvkX8Br5ngLNv1TxvUxt4cV1rGL5hj6KCesnDYUhd7oWgT11eZG7XnxHrnYeSvkzY7d2bhkJ7')
+        self.assertEqual(child.xpub(), 'xpub68Gmy5EdvgibQVfPdqkBBCHxA5htiqg55crXYuXoQRKfDBFA1WEjWgP6LHhwBZeNK1VTsfTFUHCdrfp1bgwQ9xv5ski8PX9rL2dZXvgGDnw')
+        grandchild = child.child(1)
+        self.assertEqual(grandchild.xprv(), 'xprv9wTYmMFdV23N2TdNG573QoEsfRrWKQgWeibmLntzniatZvR9BmLnvSxqu53Kw1UmYPxLgboyZQaXwTCg8MSY3H2EU4pWcQDnRnrVA1xe8fs')
+        self.assertEqual(grandchild.xpub(), 'xpub6ASuArnXKPbfEwhqN6e3mwBcDTgzisQN1wXN9BJcM47sSikHjJf3UFHKkNAWbWMiGj7Wf5uMash7SyYq527Hqck2AxYysAA7xmALppuCkwQ')
+        # public derivation has to give the same public keys
+        self.assertEqual(child.neuter().child(1).xpub(), grandchild.xpub())
+
+    def test_parse(self):
+        key = ExtendedKey.from_seed(b'\x03' * 32, testnet=True).derive("m/1/2h")
+        for s in (key.xprv(), key.xpub()):
+            parsed = ExtendedKey.parse(s)
+            self.assertEqual(parsed.point, key.point)
+            self.assertEqual(parsed.child_number, key.child_number)
+            self.assertEqual(parsed.parent_fingerprint, key.parent_fingerprint)
+            self.assertTrue(parsed.testnet)
+            self.assertEqual(parsed.xpub(), key.xpub())
+        self.assertEqual(ExtendedKey.parse(key.xprv()).xprv(), key.xprv())
+        self.assertFalse(ExtendedKey.parse(key.xpub()).is_private())
+
+    def test_children(self):
+        account = ExtendedKey.from_seed(b'\x01' * 32).derive("m/44h/0h/0h/0")
+        children = account.children(0, 30)
+        public = account.neuter().children(0, 30)
+        for i, (child, public_child) in enumerate(zip(children, public)):
+            self.assertEqual(child.child_number, i)
+            self.assertEqual(child.parent_fingerprint, account.fingerprint())
+            self.assertEqual(child.private_key().point, child.point)
+            self.assertEqual(public_child.point, child.point)
+            self.assertEqual(child.xpub(), account.child(i).xpub())
+        with self.assertRaises(ValueError):
+            account.neuter().child(HARDENED)
+
+    def test_scan(self):
+        account = ExtendedKey.from_seed(b'\x02' * 32).derive("m/44h/0h/0h/0")
+        used = {account.child(i).address() for i in (0, 1, 5, 24, 50)}
+        derived = []
+
+        def is_used(child):
+            derived.append(child.child_number)
+            return child.address() in used
+
+        found = [c.child_number for c in scan(account, is_used, gap_limit=20, batch_size=7)]
+        # 50 is more than 20 unused after 24, so it isn't found
+        self.assertEqual(found, [0, 1, 5, 24])
+        self.assertEqual(derived, list(range(45)))
@@ -7,6 +7,20 @@ SIGHASH_ALL = 1
 SIGHASH_NONE = 2
 SIGHASH_SINGLE = 3
 BASE58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+# value of each base58 character, instead of searching the alphabet
+BASE58_INDEX = {c: i for i, c in enumerate(BASE58_ALPHABET)}
+# base58 numbers are converted this many digits at a time so that most of
+# the arithmetic is on small ints instead of the whole number
+BASE58_CHUNK = 10
+BASE58_CHUNK_BASE = 58**BASE58_CHUNK
+# every two digit string, for turning a chunk into digits two at a time
+BASE58_PAIRS = [a + b for a in BASE58_ALPHABET for b in BASE58_ALPHABET]
+BECH32_ALPHABET = 'qpzry9x8gf2tvdw0s3jn54khce6mua7l'
+BECH32_INDEX = {c: i for i, c in enumerate(BECH32_ALPHABET)}
+# what the checksum polymod comes out to for each version of bech32
+BECH32 = 1
+BECH32M = 0x2bc830a3
+BECH32_GENERATOR = (0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3)
 TWO_WEEKS = 60 * 60 * 24 * 14
 MAX_TARGET = 0xffff * 256**(0x1d - 3)
 
@@ -31,21 +45,36 @@ def sha256(s):
     return hashlib.sha256(s).digest()
 
 
+# sha256(tag) twice over, for each tag tagged_hash has seen
+TAG_PREFIXES = {}
+
+
+def tagged_hash(tag, s):
+    '''BIP340 tagged hash: sha256(sha256(tag) + sha256(tag) + s), which
+    keeps hashes made for one purpose from being reused for another'''
+    prefix = TAG_PREFIXES.get(tag)
+    if prefix is None:
+        prefix = hashlib.sha256(tag.encode('ascii')).digest() * 2
+        TAG_PREFIXES[tag] = prefix
+    return hashlib.sha256(prefix + s).digest()
+
+
 def encode_base58(s):
     # determine how many 0 bytes (b'\x00') s starts with
-    count = 0
-    for c in s:
-        if c == 0:
-            count += 1
-        else:
-            break
+    count = len(s) - len(s.lstrip(b'\x00'))
     # convert to big endian integer
     num = int.from_bytes(s, 'big')
     prefix = '1' * count
-    result = ''
+    # peel off BASE58_CHUNK digits per divmod of the big number, collecting
+    # the pieces least significant first rather than prepending strings
+    pieces = []
     while num > 0:
-        num, mod = divmod(num, 58)
-        result = BASE58_ALPHABET[mod] + result
+        num, chunk = divmod(num, BASE58_CHUNK_BASE)
+        for _ in range(BASE58_CHUNK // 2):
+            chunk, pair = divmod(chunk, 58 * 58)
+            pieces.append(BASE58_PAIRS[pair])
+    # the last chunk was padded with zeros, which are 1s in base58
+    result = ''.join(reversed(pieces)).lstrip('1')
     return prefix + result
 
 
@@ -53,16 +82,205 @@ def encode_base58_checksum(s):
     return encode_base58(s + hash256(s)[:4])
 
 
-def decode_base58(s):
+def decode_base58_raw(s):
+    '''Returns the bytes that a base58 string of any length encodes'''
+    # each leading 1 is a leading 0 byte
+    count = len(s) - len(s.lstrip('1'))
     num = 0
-    for c in s:
-        num *= 58
-        num += BASE58_ALPHABET.index(c)
-    combined = num.to_bytes(25, byteorder='big')
+    try:
+        # the first chunk is short so the rest line up
+        start = len(s) % BASE58_CHUNK
+        if start:
+            for c in s[:start]:
+                num = num * 58 + BASE58_INDEX[c]
+        for i in range(start, len(s), BASE58_CHUNK):
+            chunk = 0
+            for c in s[i:i + BASE58_CHUNK]:
+                chunk = chunk * 58 + BASE58_INDEX[c]
+            num = num * BASE58_CHUNK_BASE + chunk
+    except KeyError as e:
+        raise ValueError('{} is not a base58 character'.format(e))
+    return b'\x00' * count + num.to_bytes((num.bit_length() + 7) // 8, 'big')
+
+
+def decode_base58_checksum(s):
+    '''Returns the payload of a base58 string with a 4 byte checksum on
+    the end, raising ValueError if the checksum is wrong'''
+    combined = decode_base58_raw(s)
     checksum = combined[-4:]
-    if hash256(combined[:-4])[:4] != checksum:
+    if len(combined) < 4 or hash256(combined[:-4])[:4] != checksum:
         raise ValueError('bad address: {} {}'.format(checksum, hash256(combined[:-4])[:4]))
-    return combined[1:-4]
+    return combined[:-4]
+
+
+def decode_base58(s):
+    '''Returns the hash160 of a base58 address, which has to be a version
+    byte and 20 bytes; decode_base58_checksum takes any length'''
+    payload = decode_base58_checksum(s)
+    if len(payload) != 21:
+        raise ValueError('{} is not an address, its payload is {} bytes'.format(
+            s, len(payload)))
+    return payload[1:]
+
+
+def encode_many(payloads):
+    '''encode_base58_checksum for a list of payloads'''
+    return [encode_base58_checksum(s) for s in payloads]
+
+
+def decode_many(strings):
+    '''decode_base58_checksum for a list of strings, with None in place
+    of any that aren't valid, so a whole batch can be checked at once'''
+    result = []
+    for s in strings:
+        try:
+            result.append(decode_base58_checksum(s))
+        except ValueError:
+            result.append(None)
+    return result
+
+
+def bech32_step_table(steps):
+    '''Returns what feeding steps zero values into the bech32 polymod
+    does to each possible value of its top 5*steps bits'''
+    table = []
+    for top in range(1 << (5 * steps)):
+        chk = top << (30 - 5 * steps)
+        for _ in range(steps):
+            b = chk >> 25
+            chk = (chk & 0x1ffffff) << 5
+            for i in range(5):
+                if (b >> i) & 1:
+                    chk ^= BECH32_GENERATOR[i]
+        table.append(chk)
+    return table
+
+
+# the polymod is linear, so two steps at a time are a shift, an xor of
+# both values and a lookup on the 10 bits shifted out
+BECH32_TABLE = bech32_step_table(1)
+BECH32_PAIR_TABLE = bech32_step_table(2)
+
+
+def bech32_polymod(values, chk=1):
+    '''The BCH checksum function of BIP173, continuing from chk'''
+    start = len(values) % 2
+    if start:
+        chk = ((chk & 0x1ffffff) << 5) ^ values[0] ^ BECH32_TABLE[chk >> 25]
+    for i in range(start, len(values), 2):
+        chk = ((chk & 0xfffff) << 10) ^ (values[i] << 5) ^ values[i + 1] \
+            ^ BECH32_PAIR_TABLE[chk >> 20]
+    return chk
+
+
+# polymod state after the expanded human readable part, for each hrp
+BECH32_HRP_STATES = {}
+
+
+def bech32_hrp_state(hrp):
+    state = BECH32_HRP_STATES.get(hrp)
+    if state is None:
+        expanded = [ord(c) >> 5 for c in hrp] + [0] + [ord(c) & 31 for c in hrp]
+        state = BECH32_HRP_STATES[hrp] = bech32_polymod(expanded)
+    return state
+
+
+def encode_bech32(hrp, data, spec=BECH32):
+    '''Returns the bech32 (or, with spec=BECH32M, bech32m) string for a
+    human readable part and a list of 5-bit values'''
+    polymod = bech32_polymod(list(data) + [0] * 6, bech32_hrp_state(hrp)) ^ spec
+    checksum = [(polymod >> 5 * (5 - i)) & 31 for i in range(6)]
+    return hrp + '1' + ''.join(BECH32_ALPHABET[d] for d in data) \
+        + ''.join(BECH32_ALPHABET[d] for d in checksum)
+
+
+def decode_bech32(s):
+    '''Returns (hrp, 5-bit values, spec) for a bech32 or bech32m string,
+    raising ValueError if it isn't valid'''
+    if len(s) > 90:
+        raise ValueError('bech32 strings are at most 90 characters')
+    if s.lower() != s and s.upper() != s:
+        raise ValueError('bech32 strings cannot mix upper and lower case')
+    s = s.lower()
+    pos = s.rfind('1')
+    if pos < 1 or pos + 7 > len(s):
+        raise ValueError('bech32 separator in the wrong place')
+    hrp = s[:pos]
+    if any(ord(c) < 33 or ord(c) > 126 for c in hrp):
+        raise ValueError('bad character in bech32 hrp')
+    try:
+        values = [BECH32_INDEX[c] for c in s[pos + 1:]]
+    except KeyError as e:
+        raise ValueError('{} is not a bech32 character'.format(e))
+    polymod = bech32_polymod(values, bech32_hrp_state(hrp))
+    if polymod == BECH32:
+        spec = BECH32
+    elif polymod == BECH32M:
+        spec = BECH32M
+    else:
+        raise ValueError('bad bech32 checksum')
+    return hrp, values[:-6], spec
+
+
+def bytes_to_5bit(s):
+    '''Regroups bytes into 5-bit values, padding the end with 0 bits'''
+    count = (len(s) * 8 + 4) // 5
+    num = int.from_bytes(s, 'big') << (count * 5 - len(s) * 8)
+    return [(num >> 5 * i) & 31 for i in reversed(range(count))]
+
+
+def from_5bit(values):
+    '''Regroups 5-bit values into bytes. The padding left over has to be
+    fewer than 8 bits, all zero.'''
+    num = 0
+    for v in values:
+        num = (num << 5) | v
+    length, padding = divmod(len(values) * 5, 8)
+    if padding > 4 or num & ((1 << padding) - 1):
+        raise ValueError('bad padding in bech32 data')
+    return (num >> padding).to_bytes(length, 'big')
+
+
+def encode_segwit_address(version, program, testnet=False):
+    '''Returns the native segwit address for a witness version and
+    program: bech32 for version 0, bech32m for later versions'''
+    hrp = 'tb' if testnet else 'bc'
+    spec = BECH32 if version == 0 else BECH32M
+    return encode_bech32(hrp, [version] + bytes_to_5bit(program), spec)
+
+
+def decode_segwit_address(address, testnet=False):
+    '''Returns (witness version, witness program) for a native segwit
+    address, raising ValueError if it isn't a valid one'''
+    hrp, values, spec = decode_bech32(address)
+    if hrp != ('tb' if testnet else 'bc'):
+        raise ValueError('wrong network for {}'.format(address))
+    if not values or values[0] > 16:
+        raise ValueError('bad witness version')
+    version = values[0]
+    if spec != (BECH32 if version == 0 else BECH32M):
+        raise ValueError('wrong checksum type for witness version {}'.format(version))
+    program = from_5bit(values[1:])
+    if not 2 <= len(program) <= 40 or (version == 0 and len(program) not in (20, 32)):
+        raise ValueError('bad witness program length {}'.format(len(program)))
+    return version, program
+
+
+def encode_segwit_many(programs, testnet=False):
+    '''encode_segwit_address for a list of (version, program) pairs'''
+    return [encode_segwit_address(v, p, testnet) for v, p in programs]
+
+
+def decode_segwit_many(addresses, testnet=False):
+    '''decode_segwit_address for a list of addresses, with None in place
+    of any that aren't valid'''
+    result = []
+    for address in addresses:
+        try:
+            result.append(decode_segwit_address(address, testnet))
+        except ValueError:
+            result.append(None)
+    return result
 
 
 def little_endian_to_int(b):
@@ -311,6 +529,68 @@ class HelperTest(TestCase):
         got = encode_base58_checksum(b'\x6f' + bytes.fromhex(h160))
         self.assertEqual(got, addr)
 
+    def test_base58_lengths(self):
+        for s in (b'', b'\x00', b'\x00\x00\x01', b'\x01' * 7, bytes(range(1, 100))):
+            self.assertEqual(decode_base58_raw(encode_base58(s)), s)
+        self.assertEqual(encode_base58(b'\x00\x00\xff'), '115Q')
+        xprv = 'xprv9s21ZrQH143K3QTDL4LXw2F7HEK3wJUD2nW2nRk4stbPy6cq3jPPqjiChkVvvNKmPGJxWUtg6LnF5kejMRNNU3TGtRBeJgk33yuGBxrMPHi'
+        payload = decode_base58_checksum(xprv)
+        self.assertEqual(len(payload), 78)
+        self.assertEqual(encode_base58_checksum(payload), xprv)
+        # an extended key is valid base58check but not an address
+        with self.assertRaises(ValueError):
+            decode_base58(xprv)
+        with self.assertRaises(ValueError):
+            decode_base58(encode_base58_checksum(bytes(22)))
+        with self.assertRaises(ValueError):
+            decode_base58('mnrVtF8DWjMu839VW3rBfgYaAfKk8983X0')
+        with self.assertRaises(ValueError):
+            decode_base58('mnrVtF8DWjMu839VW3rBfgYaAfKk8983Xg')
+
+    def test_bech32(self):
+        for s in ('A12UEL5L', 'a12uel5l', 'abcdef1qpzry9x8gf2tvdw0s3jn54khce6mua7lmqqqxw'):
+            self.assertEqual(decode_bech32(s)[2], BECH32)
+        for s in ('A1LQFN3A', 'a1lqfn3a'):
+            self.assertEqual(decode_bech32(s)[2], BECH32M)
+        for s in ('a12uel5m', 'A12uEL5L', '12uel5l', 'a1b2uel5l'):
+            with self.assertRaises(ValueError):
+                decode_bech32(s)
+        self.assertEqual(encode_bech32('a', []), 'a12uel5l')
+        self.assertEqual(encode_bech32('a', [], BECH32M), 'a1lqfn3a')
+
+    def test_segwit_address(self):
+        tests = (
+            (0, '751e76e8199196d454941c45d1b3a323f1433bd6', False,
+             'bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t4'),
+            (0, '1863143c14c5166804bd19203356da136c985678cd4d27a1b8c6329604903262', True,
+             'tb1qrp33g0q5c5txsp9arysrx4k6zdkfs4nce4xj0gdcccefvpysxf3q0sl5k7'),
+            (1, '79be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798', False,
+             'bc1p0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7vqzk5jj0'),
+        )
+        for version, program, testnet, address in tests:
+            program = bytes.fromhex(program)
+            self.assertEqual(encode_segwit_address(version, program, testnet), address)
+            self.assertEqual(decode_segwit_address(address, testnet), (version, program))
+            self.assertEqual(decode_segwit_address(address.upper(), testnet), (version, program))
+            with self.assertRaises(ValueError):
+                decode_segwit_address(address, not testnet)
+        # version 0 with a bech32m checksum
+        bad = encode_bech32('bc', [0] + bytes_to_5bit(bytes(20)), BECH32M)
+        with self.assertRaises(ValueError):
+            decode_segwit_address(bad)
+        # version 0 programs are 20 or 32 bytes
+        with self.assertRaises(ValueError):
+            decode_segwit_address(encode_segwit_address(0, bytes(21)))
+        addresses = encode_segwit_many([(0, bytes(20)), (1, bytes(32))])
+        self.assertEqual(decode_segwit_many(addresses + [bad]), [(0, bytes(20)), (1, bytes(32)), None])
+
+    def test_base58_many(self):
+        payloads = [b'\x6f' + bytes([i]) * 20 for i in range(5)]
+        encoded = encode_many(payloads)
+        self.assertEqual(encoded[0], encode_base58_checksum(payloads[0]))
+        self.assertEqual(decode_many(encoded), payloads)
+        self.assertEqual(decode_many(['mnrVtF8DWjMu839VW3rBfgYaAfKk8983Xg', encoded[1]]), [None, payloads[1]])
+
     def test_p2pkh_address(self):
         h160 = bytes.fromhex('74d691da1574e6b3c192ecfb52cc8984ee7b6c56')
         want = '1BenRpVUFK65JFWcQSuHnJKzc4M8ZP8Eqa'
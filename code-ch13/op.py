@@ -659,7 +659,7 @@ def op_hash256(stack):
     return True
 
 
-def op_checksig(stack, z):
+def op_checksig(stack, z, verifier=None):
     # check that there are at least 2 elements on the stack
     if len(stack) < 2:
         return False
@@ -668,24 +668,29 @@ def op_checksig(stack, z):
     # the next element of the stack is the DER signature
     # take off the last byte of the signature as that's the hash_type
     der_signature = stack.pop()[:-1]
-    # parse the serialized pubkey and signature into objects
-    try:
-        point = S256Point.parse(sec_pubkey)
-        sig = Signature.parse(der_signature)
-    except (ValueError, SyntaxError) as e:
-        LOGGER.info(e)
-        return False
-    # verify the signature using S256Point.verify()
+    if verifier is not None:
+        # the verifier hook takes the raw bytes and does the checking
+        valid = verifier(sec_pubkey, der_signature, z)
+    else:
+        # parse the serialized pubkey and signature into objects
+        try:
+            point = S256Point.parse(sec_pubkey)
+            sig = Signature.parse(der_signature)
+        except (ValueError, SyntaxError) as e:
+            LOGGER.info(e)
+            return False
+        # verify the signature using S256Point.verify()
+        valid = point.verify(z, sig)
     # push an encoded 1 or 0 depending on whether the signature verified
-    if point.verify(z, sig):
+    if valid:
         stack.append(encode_num(1))
     else:
         stack.append(encode_num(0))
     return True
 
 
-def op_checksigverify(stack, z):
-    return op_checksig(stack, z) and op_verify(stack)
+def op_checksigverify(stack, z, verifier=None):
+    return op_checksig(stack, z, verifier) and op_verify(stack)
 
 
 def op_checkmultisig(stack, z):
@@ -707,23 +712,25 @@ def op_checkmultisig(stack, z):
     # OP_CHECKMULTISIG bug
     stack.pop()
     try:
-        # parse all the points
-        points = [S256Point.parse(sec) for sec in sec_pubkeys]
         # parse all the signatures
-        sigs = [Signature.parse(der) for der in der_signatures]
+        sigs = Signature.parse_many(der_signatures)
         # loop through the signatures
         for sig in sigs:
-            # if we have no more points, signatures are no good
-            if len(points) == 0:
+            # recover the keys this signature could be from, which costs
+            # the same as one verification no matter how many keys there are
+            candidates = set()
+            for point in sig.recover_candidates(z):
+                candidates.add(point.sec(compressed=True))
+                candidates.add(point.sec(compressed=False))
+            # we loop until we find the pubkey which goes with this signature
+            while sec_pubkeys:
+                # get the current pubkey from the list of pubkeys
+                if sec_pubkeys.pop(0) in candidates:
+                    break
+            else:
+                # if we have no more pubkeys, signatures are no good
                 LOGGER.info("signatures no good or not in right order")
                 return False
-            # we loop until we find the point which works with this signature
-            while points:
-                # get the current point from the list of points
-                point = points.pop(0)
-                # we check if this signature goes with the current point
-                if point.verify(z, sig):
-                    break
         # the signatures are valid, so push a 1 to the stack
         stack.append(encode_num(1))
     except (ValueError, SyntaxError):
@@ -786,6 +793,12 @@ class OpTest(TestCase):
         stack = [sig, sec]
         self.assertTrue(op_checksig(stack, z))
         self.assertEqual(decode_num(stack[0]), 1)
+        # a verifier hook gets the raw bytes without the hash type
+        calls = []
+        stack = [sig, sec]
+        self.assertTrue(op_checksig(stack, z, lambda *job: calls.append(job)))
+        self.assertEqual(calls, [(sec, sig[:-1], z)])
+        self.assertEqual(decode_num(stack[0]), 0)
 
     def test_op_checkmultisig(self):
         z = 0xe71bfa115715d6fd33796948126f40a8cdd39f187e4afb03896795189fe1423c
@@ -796,6 +809,13 @@ class OpTest(TestCase):
         stack = [b'', sig1, sig2, b'\x02', sec1, sec2, b'\x02']
         self.assertTrue(op_checkmultisig(stack, z))
         self.assertEqual(decode_num(stack[0]), 1)
+        # signatures have to be in the same order as the pubkeys
+        stack = [b'', sig2, sig1, b'\x02', sec1, sec2, b'\x02']
+        self.assertFalse(op_checkmultisig(stack, z))
+        # 1-of-3 where the signature is for the last pubkey
+        sec3 = bytes.fromhex('0279be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798')
+        stack = [b'', sig2, b'\x01', sec2, sec3, sec1, b'\x03']
+        self.assertTrue(op_checkmultisig(stack, z))
 
 
 OP_CODE_FUNCTIONS = {
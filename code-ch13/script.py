@@ -4,6 +4,7 @@ from unittest import TestCase
 
 from helper import (
     decode_base58,
+    encode_segwit_address,
     encode_varint,
     h160_to_p2pkh_address,
     h160_to_p2sh_address,
@@ -153,7 +154,7 @@ class Script:
         # encode_varint the total length of the result and prepend
         return encode_varint(total) + result
 
-    def evaluate(self, z, witness):
+    def evaluate(self, z, witness, verifier=None):
         # create a copy as we may need to add to this list if we have a
         # RedeemScript
         cmds = self.cmds[:]
@@ -174,7 +175,22 @@ class Script:
                     if not operation(stack, altstack):
                         LOGGER.info('bad op: {}'.format(OP_CODE_NAMES[cmd]))
                         return False
-                elif cmd in (172, 173, 174, 175):
+                elif cmd in (172, 173):
+                    # op_checksig/op_checksigverify need a sig_hash to
+                    # check against and can pass the check to a verifier.
+                    # A verifier may answer now and check later, which is
+                    # only safe where a bad signature fails the script
+                    # anyway: op_checksigverify, or op_checksig that is
+                    # the last opcode or followed by op_verify. Anything
+                    # else (op_checksig op_not, say) is checked right here.
+                    if cmd == 173 or len(cmds) == 0 or cmds[0] == 0x69:
+                        check = verifier
+                    else:
+                        check = None
+                    if not operation(stack, z, check):
+                        LOGGER.info('bad op: {}'.format(OP_CODE_NAMES[cmd]))
+                        return False
+                elif cmd in (174, 175):
                     # these are signing operations, they need a sig_hash
                     # to check against
                     if not operation(stack, z):
@@ -287,6 +303,9 @@ class Script:
             h160 = self.cmds[1]
             # convert to p2sh address using h160_to_p2sh_address (remember testnet)
             return h160_to_p2sh_address(h160, testnet)
+        elif self.is_p2wpkh_script_pubkey() or self.is_p2wsh_script_pubkey():
+            # witness version 0, and the program is the 2nd cmd
+            return encode_segwit_address(0, self.cmds[1], testnet)
         raise ValueError('Unknown ScriptPubKey')
 
 
@@ -319,3 +338,9 @@ class ScriptTest(TestCase):
         self.assertEqual(p2sh_script_pubkey.address(), address_3)
         address_4 = '2N3u1R6uwQfuobCqbCgBkpsgBxvr1tZpe7B'
         self.assertEqual(p2sh_script_pubkey.address(testnet=True), address_4)
+        h160 = bytes.fromhex('751e76e8199196d454941c45d1b3a323f1433bd6')
+        address_5 = 'bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t4'
+        self.assertEqual(p2wpkh_script(h160).address(), address_5)
+        h256 = bytes.fromhex('1863143c14c5166804bd19203356da136c985678cd4d27a1b8c6329604903262')
+        address_6 = 'tb1qrp33g0q5c5txsp9arysrx4k6zdkfs4nce4xj0gdcccefvpysxf3q0sl5k7'
+        self.assertEqual(p2wsh_script(h256).address(testnet=True), address_6)
@@ -4,7 +4,11 @@ from unittest import TestCase
 import json
 import requests
 
-from ecc import PrivateKey
+from ecc import (
+    DeferredVerifier,
+    PrivateKey,
+    VerifyExecutor,
+)
 from helper import (
     encode_varint,
     hash256,
@@ -64,6 +68,10 @@ class TxFetcher:
 # tag::source1[]
 class Tx:
     command = b'tx'
+    __slots__ = (
+        'version', 'tx_ins', 'tx_outs', 'locktime', 'testnet', 'segwit',
+        '_hash_prevouts', '_hash_sequence', '_hash_outputs',
+    )
 
     def __init__(self, version, tx_ins, tx_outs, 
         locktime, testnet=False, segwit=False):
@@ -299,8 +307,9 @@ class Tx:
         s += int_to_little_endian(SIGHASH_ALL, 4)
         return int.from_bytes(hash256(s), 'big')
 
-    def verify_input(self, input_index):
-        '''Returns whether the input has a valid signature'''
+    def verify_input(self, input_index, verifier=None):
+        '''Returns whether the input has a valid signature. verifier, if
+        given, is called with (sec, der, z) for each OP_CHECKSIG.'''
         # get the relevant input
         tx_in = self.tx_ins[input_index]
         # grab the previous ScriptPubKey
@@ -342,17 +351,25 @@ class Tx:
         # combine the current ScriptSig and the previous ScriptPubKey
         combined = tx_in.script_sig + script_pubkey
         # evaluate the combined script
-        return combined.evaluate(z, witness)
+        return combined.evaluate(z, witness, verifier)
 
-    def verify(self):
-        '''Verify this transaction'''
+    def verify(self, executor=None):
+        '''Verify this transaction. If a VerifyExecutor is given, the
+        OP_CHECKSIG signatures are checked all at once in its worker
+        processes after the scripts have run.'''
         # check that we're not creating money
         if self.fee() < 0:
             return False
+        if executor is None:
+            verifier = None
+        else:
+            verifier = DeferredVerifier()
         # check that each input has a valid ScriptSig
         for i in range(len(self.tx_ins)):
-            if not self.verify_input(i):
+            if not self.verify_input(i, verifier):
                 return False
+        if verifier is not None:
+            return verifier.finish(executor)
         return True
 
     def sign_input(self, input_index, private_key):
@@ -401,6 +418,7 @@ class Tx:
 
 
 class TxIn:
+    __slots__ = ('prev_tx', 'prev_index', 'script_sig', 'sequence', 'witness')
 
     def __init__(self, prev_tx, prev_index, script_sig=None, sequence=0xffffffff):
         self.prev_tx = prev_tx
@@ -470,6 +488,7 @@ class TxIn:
 
 
 class TxOut:
+    __slots__ = ('amount', 'script_pubkey')
 
     def __init__(self, amount, script_pubkey):
         self.amount = amount
@@ -591,6 +610,35 @@ class TxTest(TestCase):
         tx = TxFetcher.fetch('5418099cc755cb9dd3ebc6cf1a7888ad53a1a3beb5a025bce89eb1bf7f1650a2', testnet=True)
         self.assertTrue(tx.verify())
 
+    def test_verify_executor(self):
+        with VerifyExecutor(max_workers=2) as executor:
+            tx = TxFetcher.fetch('452c629d67e41baec3ac6f04fe744b4b9617f8f859c63b3002f8684e7a4fee03')
+            self.assertTrue(tx.verify(executor))
+            tx = TxFetcher.fetch('d869f854e1f8788bcff294cc83b280942a8c728de71eb709a2c29d10bfe21b7c', testnet=True)
+            self.assertTrue(tx.verify(executor))
+
+    def test_verify_executor_failing_checksig(self):
+        # OP_CHECKSIG OP_NOT succeeds exactly when the signature is bad,
+        # so that check can't be deferred
+        pk = PrivateKey(8675309)
+        sec = pk.point.sec()
+        for cmds, valid in (([sec, 0xac, 0x91], True), ([sec, 0xac], False)):
+            prev = Tx(1, [], [TxOut(10000, Script(cmds))], 0, testnet=True)
+            TxFetcher.cache[prev.id()] = prev
+            try:
+                tx_in = TxIn(bytes.fromhex(prev.id()), 0)
+                tx = Tx(1, [tx_in], [TxOut(9000, Script(cmds))], 0, testnet=True)
+                z = tx.sig_hash(0)
+                # a signature for the wrong z
+                sig = pk.sign(z + 1).der() + SIGHASH_ALL.to_bytes(1, 'big')
+                tx_in.script_sig = Script([sig])
+                self.assertEqual(tx.verify(), valid)
+                with VerifyExecutor(max_workers=1) as executor:
+                    self.assertEqual(tx.verify(executor), valid)
+            finally:
+                # keep the made up transaction out of the cache file
+                del TxFetcher.cache[prev.id()]
+
     def test_verify_p2sh(self):
         tx = TxFetcher.fetch('46df1a9484d0a81d03ce0ee543ab6e1a23ed06175c104a178268fad381216c2b')
         self.assertTrue(tx.verify())